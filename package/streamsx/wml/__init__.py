@@ -5,6 +5,36 @@
 """
 Changes
 +++++++
+v1.2.0:
+
+- new: parameter max_bundle_wait_ms to wait for full bundles before a partial
+  bundle is sent for scoring
+- new: parameter adaptive_bundle_size with min_bundle_size, max_bundle_size and
+  target_latency_ms to adapt the bundle size to the scoring request latency
+- new: parameter engine with value "async" to send max_in_flight concurrent scoring
+  requests per thread using asyncio and aiohttp
+- new: parameter transport with value "direct" to send scoring requests through a
+  connection pool without WML client overhead for each request
+- new: parameter compression_threshold to gzip compress large scoring requests
+- new: parameter serializer, scoring requests sent directly are encoded with orjson or
+  ujson if installed, numpy arrays are serialized without conversion to lists
+- new: parameter isolate_invalid_input to split bundles rejected as invalid until the
+  invalid input data are found, only those are submitted with PredictionError
+- new: parameters retry_max_attempts, retry_backoff_ms, retry_backoff_cap_ms, retry_jitter
+  and retry_status_codes to retry scoring requests failing with transient errors
+- new: parameter preserve_order, with False results are submitted as soon as their
+  bundle is scored instead of in input order
+- new: parameters output_schema and prediction_mapping to submit the results as structured
+  SPL tuples instead of pickled Python objects
+- new: parameter numeric_input to map bundles of numeric input data vectorized with numpy
+- new: numpy array input of the '__array__' mapping is stacked into one array per bundle, array.array and bytes input accepted
+- new: parameter output_fields to keep only selected input attributes in the output tuples
+- new: parameter prediction_format 'values' to submit the prediction values without the field names
+- new: parameters cache_size, cache_ttl_ms and cache_version_check_ms to reuse the predictions of already scored input values
+- new: parameters connect_timeout_ms and read_timeout_ms for scoring requests sent directly
+- fix: output order of the results wasn't reliably kept
+- fix: results of models with several prediction blocks kept only the last block
+
 v1.1.0:
 
 - replace the deprecated WML client
@@ -146,7 +176,7 @@ set to predict the Iris species from size of the petal and sepal of an exemplar:
 """
 
 
-__version__='1.1.0'
+__version__='1.2.0'
 
 __all__ = ['wml_online_scoring']
 from streamsx.wml._wml import wml_online_scoring
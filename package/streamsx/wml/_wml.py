@@ -21,6 +21,17 @@ def _add_toolkit(topo):
     # the toolkit is part of this streamsx.wml python package
     streamsx.spl.toolkit.add_toolkit(topo, os.path.dirname(os.path.realpath(__file__))+'/'+PRIVATE_WML_TOOLKIT_LOCATION)
 
+def _check_output_schema(schema):
+    # StreamSchema and CommonSchema are used as is, an SPL schema string is parsed,
+    # a typing.NamedTuple is converted by the topology when the output ports are created
+    if isinstance(schema, (StreamSchema, CommonSchema)):
+        return schema
+    if isinstance(schema, str):
+        return StreamSchema(schema)
+    if isinstance(schema, type) and issubclass(schema, tuple) and hasattr(schema, '_fields') and getattr(schema, '__annotations__', None):
+        return schema
+    raise ValueError("Unknown stream schema type:" + str(schema))
+
 
 def wml_online_scoring( stream, 
                         deployment_guid, 
@@ -35,7 +46,34 @@ def wml_online_scoring( stream,
                         node_count = 1, 
                         connectionConfiguration=None, 
                         name = None,
-                        bundle_size = 100):
+                        bundle_size = 100,
+                        max_bundle_wait_ms = 0,
+                        adaptive_bundle_size = False,
+                        min_bundle_size = 1,
+                        max_bundle_size = None,
+                        target_latency_ms = 1000,
+                        engine = "sync",
+                        max_in_flight = 8,
+                        transport = "client",
+                        compression_threshold = None,
+                        serializer = "auto",
+                        connect_timeout_ms = 10000,
+                        read_timeout_ms = 60000,
+                        isolate_invalid_input = False,
+                        retry_max_attempts = 1,
+                        retry_backoff_ms = 100,
+                        retry_backoff_cap_ms = 10000,
+                        retry_jitter = True,
+                        retry_status_codes = None,
+                        preserve_order = True,
+                        output_schema = None,
+                        prediction_mapping = None,
+                        numeric_input = False,
+                        output_fields = None,
+                        prediction_format = "dict",
+                        cache_size = 0,
+                        cache_ttl_ms = 0,
+                        cache_version_check_ms = 60000):
     """
     Scoring tuples received from input :py:class:`stream` using the online scoring endpoint of WML referenced by the :py:class:`deployment_guid`.
     Mapping from input attributes to the models minning fields is done by the :py:class:`field_mapping` parameter.
@@ -77,6 +115,125 @@ def wml_online_scoring( stream,
         bundle_size (int, optional): 
             optional field for setting maximum number of tuple to be sent in one scoring request
             this value has most impact on throughput performance, defaults to 100
+        max_bundle_wait_ms (int, optional):
+            optional field for setting the maximum time in milliseconds the oldest received tuple 
+            waits for a bundle to become full, after this time a partial bundle is sent,
+            0 sends any received tuples immediately if a thread is free, defaults to 0
+            higher values reduce the number of small scoring requests at moderate tuple rates
+            but increase the latency
+        adaptive_bundle_size (bool, optional):
+            optional field to adapt the bundle size at runtime to the measured scoring request latency,
+            bundle_size is used as initial size, the size is decreased if the p99 latency is above
+            target_latency_ms and increased otherwise, defaults to False
+        min_bundle_size (int, optional):
+            optional field for the lower limit of the adaptive bundle size, defaults to 1
+        max_bundle_size (int, optional):
+            optional field for the upper limit of the adaptive bundle size, defaults to 4 times bundle_size
+        target_latency_ms (int, optional):
+            optional field for the p99 scoring request latency in milliseconds the adaptive 
+            bundle size is controlled to, defaults to 1000
+        engine (str, optional):
+            optional field to select how scoring requests are sent, defaults to "sync"
+            "sync": each thread sends one scoring request at a time using the WML client
+            "async": each thread sends up to max_in_flight scoring requests concurrently from
+            an asyncio event loop directly to the scoring endpoint, needs package aiohttp in the 
+            Streams runtime Python environment
+        max_in_flight (int, optional):
+            optional field for the number of concurrent scoring requests per thread with 
+            engine "async", the overall number is threads_per_node * node_count * max_in_flight,
+            defaults to 8
+        transport (str, optional):
+            optional field to select how engine "sync" sends the scoring requests, defaults to "client"
+            "client": each request is sent with the WML client
+            "direct": scoring URL and authorization are resolved once at operator start and the requests
+            are sent directly to the scoring endpoint using a pool of keep-alive connections, 
+            one for each thread, this avoids the WML client overhead for each request
+        compression_threshold (int, optional):
+            optional field to gzip compress scoring requests with a JSON body size of at least
+            this number of bytes and to accept compressed responses, needs transport "direct" 
+            or engine "async", defaults to None which disables compression 
+            compression reduces the network volume for wide input data and large bundles
+            at the cost of CPU
+        serializer (str, optional):
+            optional field to select the JSON library encoding scoring requests and decoding responses
+            with transport "direct" or engine "async", one of "auto", "orjson", "ujson", "json",
+            defaults to "auto" which uses the fastest installed library, orjson and ujson have to be 
+            installed in the Streams runtime Python environment
+        connect_timeout_ms (int, optional):
+            optional field for the time in milliseconds to establish the connection of a scoring request
+            with transport "direct" or engine "async", 0 waits without limit, defaults to 10000
+        read_timeout_ms (int, optional):
+            optional field for the time in milliseconds to wait for data of the scoring response
+            with transport "direct" or engine "async", 0 waits without limit, defaults to 60000,
+            a request timing out fails with a timeout error which is retried with retry_max_attempts > 1
+        isolate_invalid_input (bool, optional):
+            optional field, WML rejects a whole bundle as invalid (status 400) even if only one input
+            is invalid, if True a rejected bundle is split into halves scored separately until the
+            invalid inputs are isolated, so only those are submitted with PredictionError, 
+            the number of requests per bundle is limited, if also all halves and quarters are rejected
+            or the limit is reached the remaining inputs are submitted with the bundle's error, 
+            defaults to False which submits the whole bundle with PredictionError
+        retry_max_attempts (int, optional):
+            optional field for the overall number of attempts of a scoring request failing with a transient
+            error (retry_status_codes, connection errors and timeouts), defaults to 1 which doesn't retry
+            while retrying a thread doesn't take further input from queue, if all threads retry the full
+            queue applies back-pressure to the input stream, the output order is kept
+        retry_backoff_ms (int, optional):
+            optional field for the delay in milliseconds before the first retry, the delay is doubled 
+            for each further retry, defaults to 100
+        retry_backoff_cap_ms (int, optional):
+            optional field for the maximum delay in milliseconds before a retry, defaults to 10000
+        retry_jitter (bool, optional):
+            optional field, if True the delay is taken randomly between 0 and the backoff delay, 
+            so the threads don't retry at the same time, defaults to True
+        retry_status_codes (list, optional):
+            optional field with the HTTP status codes of scoring responses which are retried, 
+            defaults to None which retries [429, 500, 502, 503, 504]
+        preserve_order (bool, optional):
+            optional field, if True the results are submitted in the order of the input tuples,
+            a bundle with a slow scoring request delays the submission of all following bundles,
+            if False each thread submits the results of its bundle as soon as they are available,
+            which gives a higher throughput and lower latency with varying scoring response times, 
+            defaults to True
+        output_schema (:py:class:`topology_ref:streamsx.topology.schema.StreamSchema`|typing.NamedTuple|str, optional):
+            optional field with a structured schema for the output streams, the results are submitted
+            as SPL tuples instead of pickled Python objects, which avoids pickling in the operator and
+            unpickling by downstream operators, defaults to None which submits Python objects
+            attributes are set from the input tuple attributes and the prediction fields with the same 
+            name, add an attribute ``rstring PredictionError`` to receive the error message
+        prediction_mapping (list|str, optional):
+            optional field used with output_schema, list or JSON string representing the mappings between 
+            prediction fields and output tuple attributes [{'model_field':str, 'tuple_field':str},{...}],
+            defaults to None which sets each prediction field to the attribute of same name
+        numeric_input (bool, optional):
+            optional field, if True all mapped input fields are expected to be numeric, the values of a
+            bundle are mapped to one 2-dimensional numpy array of float64 and missing values are detected
+            for the whole bundle at once, None and NaN values are handled as missing, a bundle
+            with non numeric values, including numeric strings and bools, is mapped as usual, 
+            defaults to False
+        output_fields (list, optional):
+            optional field with the names of the input tuple attributes which are kept in the output
+            tuples next to the prediction or error, other input attributes are dropped, which reduces
+            the size of the submitted tuples for wide input tuples, with output_schema only the 
+            schema's attributes are submitted anyway, defaults to None which keeps all input attributes
+        prediction_format (str, optional):
+            optional field, "dict" sets the prediction to a dict of the prediction field names and values,
+            "values" sets it to the list of the prediction values only, in the order of the model's 
+            prediction fields, which are logged once by the operator, this reduces the size of the 
+            output tuples of high volume streams, "values" can't be used with output_schema, 
+            defaults to "dict"
+        cache_size (int, optional):
+            optional field with the maximum number of predictions cached by the operator, input tuples with
+            the same mapped values as an already scored tuple get the cached prediction without 
+            scoring, the least recently used predictions are removed first, defaults to 0 which 
+            disables the cache
+        cache_ttl_ms (int, optional):
+            optional field with the time in milliseconds a cached prediction is used, 
+            defaults to 0 which uses it until it is removed
+        cache_version_check_ms (int, optional):
+            optional field with the interval in milliseconds the model version of the deployment is 
+            checked, the cached predictions are removed when it changes, 0 disables the check,
+            defaults to 60000
         
     Returns:
         result_stream, error_stream(:py:class:`topology_ref:streamsx.topology.topology.Stream`, :py:class:`topology_ref:streamsx.topology.topology.Stream`):
@@ -143,6 +300,78 @@ def wml_online_scoring( stream,
     else:
         print ("wml_online_scoring() parameter 'expected_load' is depricated but still supported, consider using the new parameter 'bundle_size'")
 
+    if not isinstance(max_bundle_wait_ms, int) or max_bundle_wait_ms < 0:
+        raise Exception("wml_online_scoring() parameter 'max_bundle_wait_ms' has to be a non negative integer")
+
+    # adaptive bundle size limits, max_bundle_size 0 is passed to the operator as not set
+    if adaptive_bundle_size:
+        _initial_size = _bundle_size if _bundle_size > 0 else 1
+        if max_bundle_size is None:
+            max_bundle_size = 4 * _initial_size
+        if not isinstance(min_bundle_size, int) or not isinstance(max_bundle_size, int) or not 1 <= min_bundle_size <= max_bundle_size:
+            raise Exception("wml_online_scoring() parameters 'min_bundle_size' and 'max_bundle_size' have to be integers with 1 <= min_bundle_size <= max_bundle_size")
+        if not isinstance(target_latency_ms, int) or target_latency_ms <= 0:
+            raise Exception("wml_online_scoring() parameter 'target_latency_ms' has to be a positive integer")
+    else:
+        max_bundle_size = 0
+
+    if engine not in ("sync", "async"):
+        raise Exception("wml_online_scoring() parameter 'engine' has to be either 'sync' or 'async'")
+    if not isinstance(max_in_flight, int) or max_in_flight < 1:
+        raise Exception("wml_online_scoring() parameter 'max_in_flight' has to be a positive integer")
+    if transport not in ("client", "direct"):
+        raise Exception("wml_online_scoring() parameter 'transport' has to be either 'client' or 'direct'")
+    if compression_threshold is None:
+        compression_threshold = -1
+    elif not isinstance(compression_threshold, int) or compression_threshold < 0:
+        raise Exception("wml_online_scoring() parameter 'compression_threshold' has to be a non negative integer")
+    elif transport != "direct" and engine != "async":
+        raise Exception("wml_online_scoring() parameter 'compression_threshold' needs transport 'direct' or engine 'async'")
+    if not isinstance(isolate_invalid_input, bool):
+        raise Exception("wml_online_scoring() parameter 'isolate_invalid_input' has to be of type bool")
+    if not isinstance(retry_max_attempts, int) or retry_max_attempts < 1:
+        raise Exception("wml_online_scoring() parameter 'retry_max_attempts' has to be a positive integer")
+    if not isinstance(retry_backoff_ms, int) or not isinstance(retry_backoff_cap_ms, int) or not 0 <= retry_backoff_ms <= retry_backoff_cap_ms:
+        raise Exception("wml_online_scoring() parameters 'retry_backoff_ms' and 'retry_backoff_cap_ms' have to be integers with 0 <= retry_backoff_ms <= retry_backoff_cap_ms")
+    if not isinstance(retry_jitter, bool):
+        raise Exception("wml_online_scoring() parameter 'retry_jitter' has to be of type bool")
+    if retry_status_codes is None:
+        retry_status_codes = [429, 500, 502, 503, 504]
+    if not isinstance(retry_status_codes, list) or not all(isinstance(code, int) for code in retry_status_codes):
+        raise Exception("wml_online_scoring() parameter 'retry_status_codes' has to be a list of integers")
+    if output_schema is not None:
+        try:
+            output_schema = _check_output_schema(output_schema)
+        except ValueError:
+            raise Exception("wml_online_scoring() parameter 'output_schema' has to be a StreamSchema, a typing.NamedTuple or an SPL schema string")
+    if prediction_mapping is None:
+        prediction_mapping = []
+    elif output_schema is None:
+        raise Exception("wml_online_scoring() parameter 'prediction_mapping' needs parameter 'output_schema'")
+    if isinstance(prediction_mapping, str):
+        try:
+            prediction_mapping = json.loads(prediction_mapping)
+        except:
+            raise Exception("wml_online_scoring() parameter 'prediction_mapping' is not a valid json")
+    if not isinstance(prediction_mapping, list) or not all(isinstance(field, dict) and 'model_field' in field and 'tuple_field' in field for field in prediction_mapping):
+        raise Exception("wml_online_scoring() parameter 'prediction_mapping' has to be a list of mappings with 'model_field' and 'tuple_field'")
+    if not isinstance(numeric_input, bool):
+        raise Exception("wml_online_scoring() parameter 'numeric_input' has to be of type bool")
+    if not isinstance(preserve_order, bool):
+        raise Exception("wml_online_scoring() parameter 'preserve_order' has to be of type bool")
+    if not isinstance(cache_size, int) or not isinstance(cache_ttl_ms, int) or not isinstance(cache_version_check_ms, int) or min(cache_size, cache_ttl_ms, cache_version_check_ms) < 0:
+        raise Exception("wml_online_scoring() parameters 'cache_size', 'cache_ttl_ms' and 'cache_version_check_ms' have to be integers >= 0")
+    if prediction_format not in ("dict", "values"):
+        raise Exception("wml_online_scoring() parameter 'prediction_format' has to be one of 'dict' or 'values'")
+    if prediction_format == "values" and output_schema is not None:
+        raise Exception("wml_online_scoring() parameter 'prediction_format' 'values' can't be used with parameter 'output_schema'")
+    if output_fields is not None and (not isinstance(output_fields, list) or not all(isinstance(field, str) for field in output_fields)):
+        raise Exception("wml_online_scoring() parameter 'output_fields' has to be a list of attribute names")
+    if not isinstance(connect_timeout_ms, int) or not isinstance(read_timeout_ms, int) or min(connect_timeout_ms, read_timeout_ms) < 0:
+        raise Exception("wml_online_scoring() parameters 'connect_timeout_ms' and 'read_timeout_ms' have to be integers >= 0")
+    if serializer not in ("auto", "orjson", "ujson", "json"):
+        raise Exception("wml_online_scoring() parameter 'serializer' has to be one of 'auto', 'orjson', 'ujson' or 'json'")
+
 
     # create instance of wrapper class
     _op = _WMLOnlineScoring(stream = stream, 
@@ -158,7 +387,34 @@ def wml_online_scoring( stream,
                             node_count = node_count,
                             connectionConfiguration = connectionConfiguration, 
                             name = name,
-                            bundle_size = _bundle_size)
+                            bundle_size = _bundle_size,
+                            max_bundle_wait_ms = max_bundle_wait_ms,
+                            adaptive_bundle_size = adaptive_bundle_size,
+                            min_bundle_size = min_bundle_size,
+                            max_bundle_size = max_bundle_size,
+                            target_latency_ms = target_latency_ms,
+                            engine = engine,
+                            max_in_flight = max_in_flight,
+                            transport = transport,
+                            compression_threshold = compression_threshold,
+                            serializer = serializer,
+                            connect_timeout_ms = connect_timeout_ms,
+                            read_timeout_ms = read_timeout_ms,
+                            isolate_invalid_input = isolate_invalid_input,
+                            retry_max_attempts = retry_max_attempts,
+                            retry_backoff_ms = retry_backoff_ms,
+                            retry_backoff_cap_ms = retry_backoff_cap_ms,
+                            retry_jitter = retry_jitter,
+                            retry_status_codes = ",".join(str(code) for code in retry_status_codes),
+                            preserve_order = preserve_order,
+                            output_schema = output_schema,
+                            prediction_mapping = json.dumps(prediction_mapping),
+                            numeric_input = numeric_input,
+                            output_fields = json.dumps(output_fields),
+                            prediction_format = prediction_format,
+                            cache_size = cache_size,
+                            cache_ttl_ms = cache_ttl_ms,
+                            cache_version_check_ms = cache_version_check_ms)
 
     # calling SPL operators will result anytime in schema based output streams
     # these need to be mapped back to the Python object Stream we received
@@ -185,12 +441,41 @@ class _WMLOnlineScoring(streamsx.spl.op.Invoke):
                        node_count, 
                        connectionConfiguration, 
                        name,
-                       bundle_size):
+                       bundle_size,
+                       max_bundle_wait_ms,
+                       adaptive_bundle_size,
+                       min_bundle_size,
+                       max_bundle_size,
+                       target_latency_ms,
+                       engine,
+                       max_in_flight,
+                       transport,
+                       compression_threshold,
+                       serializer,
+                       connect_timeout_ms,
+                       read_timeout_ms,
+                       isolate_invalid_input,
+                       retry_max_attempts,
+                       retry_backoff_ms,
+                       retry_backoff_cap_ms,
+                       retry_jitter,
+                       retry_status_codes,
+                       preserve_order,
+                       output_schema,
+                       prediction_mapping,
+                       numeric_input,
+                       output_fields,
+                       prediction_format,
+                       cache_size,
+                       cache_ttl_ms,
+                       cache_version_check_ms):
 
         topology = stream.topology
         kind="com.ibm.streams.wml::WMLOnlineScoring"
         inputs=[stream]
         schemas=[object,object]  #not [StreamSchema('tuple<blob __spl_po>'),StreamSchema('tuple<blob __spl_po>')]
+        if output_schema is not None:
+            schemas=[output_schema,output_schema]
         params = dict()
         params['deployment_guid'] = deployment_guid
         params['wml_credentials'] = credentials
@@ -203,6 +488,33 @@ class _WMLOnlineScoring(streamsx.spl.op.Invoke):
         params['single_output'] = single_output
         params['node_count'] = node_count
         params['bundle_size'] = bundle_size
+        params['max_bundle_wait_ms'] = max_bundle_wait_ms
+        params['adaptive_bundle_size'] = adaptive_bundle_size
+        params['min_bundle_size'] = min_bundle_size
+        params['max_bundle_size'] = max_bundle_size
+        params['target_latency_ms'] = target_latency_ms
+        params['engine'] = engine
+        params['max_in_flight'] = max_in_flight
+        params['transport'] = transport
+        params['compression_threshold'] = compression_threshold
+        params['serializer'] = serializer
+        params['connect_timeout_ms'] = connect_timeout_ms
+        params['read_timeout_ms'] = read_timeout_ms
+        params['isolate_invalid_input'] = isolate_invalid_input
+        params['retry_max_attempts'] = retry_max_attempts
+        params['retry_backoff_ms'] = retry_backoff_ms
+        params['retry_backoff_cap_ms'] = retry_backoff_cap_ms
+        params['retry_jitter'] = retry_jitter
+        params['retry_status_codes'] = retry_status_codes
+        params['preserve_order'] = preserve_order
+        params['structured_output'] = output_schema is not None
+        params['prediction_mapping'] = prediction_mapping
+        params['numeric_input'] = numeric_input
+        params['output_fields'] = output_fields
+        params['prediction_format'] = prediction_format
+        params['cache_size'] = cache_size
+        params['cache_ttl_ms'] = cache_ttl_ms
+        params['cache_version_check_ms'] = cache_version_check_ms
 
         super(_WMLOnlineScoring, self).__init__(topology,kind,inputs,schemas,params,name)
 
@@ -8,6 +8,10 @@
 from ibm_watson_machine_learning import APIClient
 # REST handler specific imports
 from .bundleresthandler import BundleRestHandler
+from .bundlequeue import BundleQueue
+from .bundlesizer import AdaptiveBundleSize
+from .reorderbuffer import ReorderBuffer, _WINDOW_BUNDLES_PER_HANDLER_
+from .fieldmappingplan import FieldMappingPlan
 # standard python imports
 import logging
 import json
@@ -37,7 +41,15 @@ class BundleController():
                        handler_class = None,
                        field_mapping = None,
                        output_function = None,
-                       bundle_size = None
+                       bundle_size = None,
+                       max_bundle_wait_ms = 0,
+                       adaptive_bundle_size = False,
+                       min_bundle_size = 1,
+                       max_bundle_size = None,
+                       target_latency_ms = 1000,
+                       preserve_order = True,
+                       owns_input_data = False,
+                       output_fields = None
                       ):
 
         tracer.debug("__init__ called")
@@ -52,15 +64,39 @@ class BundleController():
         self._node_count = node_count
         self._max_request_size = bundle_size if expected_load is 0 else int(expected_load/self._threads_per_node/self._node_count)
         self._handler_class = handler_class
+        self._max_bundle_wait = max_bundle_wait_ms / 1000.0 if max_bundle_wait_ms else 0.0
+        # adaptive mode starts with the configured bundle size and
+        # limits it to min/max bundle size depending on the request latency
+        self._bundle_sizer = None
+        if adaptive_bundle_size:
+            if max_bundle_size is None:
+                max_bundle_size = 4 * self._max_request_size
+            self._bundle_sizer = AdaptiveBundleSize(initial_size = self._max_request_size,
+                                                    min_size = min_bundle_size,
+                                                    max_size = max_bundle_size,
+                                                    target_latency = target_latency_ms / 1000.0)
+            self._max_request_size = self._bundle_sizer.max_size
 
         
         ############################################################
         # internal variables
         ############################################################
-        self._input_queue = list([])
+        # arrival time of input data is only needed to flush partial bundles
+        self._input_queue = BundleQueue(max_size = queue_size, track_arrival = self._max_bundle_wait > 0)
+        self._append_input = self._input_queue.append_timed if self._max_bundle_wait > 0 else self._input_queue.append
         self._sending_threads = []
-        self._lock = threading.Condition() # changed to condition
+        # one lock for the input queue with two conditions on it:
+        # handlers wait on _lock for a ready bundle, the input thread waits on
+        # _space_available in case of a full queue, so a notify always
+        # reaches the right kind of thread
+        self._queue_lock = threading.Lock()
+        self._lock = threading.Condition(self._queue_lock)
+        self._space_available = threading.Condition(self._queue_lock)
         self._output_lock = threading.Lock()
+        # results are written in input order, without order each 
+        # handler writes its results directly, the bundles pending
+        # behind a stalled one are limited per handler
+        self._reorder_buffer = ReorderBuffer(output_function, window = self._threads_per_node * self._node_count * _WINDOW_BUNDLES_PER_HANDLER_) if preserve_order else None
         self._thread_finish_counter = 0
 
         
@@ -71,10 +107,20 @@ class BundleController():
         ############################################################
         self._handler_class.max_copy_size = self._max_request_size
         self._handler_class.input_list_lock = self._lock
+        self._handler_class.input_list_space = self._space_available
+        self._handler_class.max_bundle_wait = self._max_bundle_wait
+        self._handler_class.bundle_sizer = self._bundle_sizer
         self._handler_class.source_data_list = self._input_queue
         self._handler_class.single_output = self._single_output
         self._handler_class.field_mapping = json.loads(field_mapping)
+        # compiled once for all handlers and tuples
+        self._handler_class.field_mapping_plan = FieldMappingPlan(self._handler_class.field_mapping)
         self._handler_class.output_function = output_function
+        self._handler_class.keep_data_order = preserve_order
+        self._handler_class.reorder_buffer = self._reorder_buffer
+        # input data nobody else references is extended with the result instead of copied
+        self._handler_class.owns_input_data = owns_input_data
+        self._handler_class.output_fields = tuple(output_fields) if output_fields is not None else None
 
         tracer.debug("__init__ finished")
         return
@@ -83,12 +129,26 @@ class BundleController():
         """It is called for every single input data
         It will be just stored in the input queue. On max queue size processing
         blocks and backpressure on the up-stream/sending_thread happens.
+        A waiting handler is only notified if a bundle became ready, handlers
+        which are busy take the queued data without notification when they
+        are back. With max_bundle_wait_ms the handler notified for the first
+        data waits until the bundle is full or the wait time is over.
         """
-        with self._lock:
-            self._lock.wait_for(lambda : len(self._input_queue) <= self._max_queue_size)
-            self._input_queue.append(input_data)
-            self._lock.notify()
-
+        input_queue = self._input_queue
+        with self._queue_lock:
+            if input_queue.is_full():
+                self._space_available.wait_for(lambda : not input_queue.is_full())
+            self._append_input(input_data)
+            queue_length = len(input_queue)
+            # first data in empty queue (starts the wait time) or a full bundle is available 
+            if queue_length == 1 or queue_length == self._get_bundle_size():
+                self._lock.notify()
+
+
+    def _get_bundle_size(self):
+        if self._bundle_sizer is not None:
+            return self._bundle_sizer.size
+        return self._max_request_size
 
     def prepare(self):
         self._create_sending_threads()
@@ -0,0 +1,93 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class BundleQueue is the input queue shared by the controller and all handlers
+
+- the controller (Streams input thread) appends single input data at the end
+- the handlers take bundles of the oldest input data from the front
+- appending is O(1), taking a bundle is O(bundle size) independent of the
+  number of queued elements, no memmove of the remaining queue happens
+- the queue is bounded by max_size, blocking/backpressure is done by the
+  user of the queue as it owns the lock
+- optionally the arrival time of each element is tracked, needed to flush
+  partial bundles after a maximum wait time
+
+'''
+
+from collections import deque
+from itertools import repeat, starmap
+import logging
+import time
+
+tracer = logging.getLogger(__name__)
+
+
+class BundleQueue(deque):
+
+    def __init__(self, iterable = (), max_size = None, track_arrival = False):
+        '''Creates the queue, optionally pre filled with the elements of iterable.
+        max_size is the number of elements after which the queue is reported as full,
+        None means unbounded.
+        With track_arrival elements have to be added with append_timed() and
+        oldest_arrival() returns the arrival time of the oldest element.
+        '''
+        super().__init__(iterable)
+        self.max_size = max_size
+        self.arrival_times = None
+        if track_arrival:
+            now = time.monotonic()
+            self.arrival_times = deque(now for _ in range(len(self)))
+
+    def is_full(self):
+        '''True if the queue holds more than max_size elements.
+        Same semantic as the former list based queue check, where one element
+        above max_size was accepted before blocking.
+        '''
+        return self.max_size is not None and len(self) > self.max_size
+
+    def pop_bundle(self, max_count):
+        '''Removes and returns the oldest max_count elements as list.
+        If the queue holds less elements, all elements are returned.
+        '''
+        count = min(int(max_count), len(self))
+        if self.arrival_times is not None:
+            popleft = self.arrival_times.popleft
+            for _ in repeat(None, count):
+                popleft()
+        # calls popleft() count times without a python level loop
+        return list(starmap(self.popleft, repeat((), count)))
+
+    def pop_bundle_into(self, bundle, max_count):
+        '''Same as pop_bundle(), but the elements replace the content of the list bundle.
+        The list keeps its allocated memory as long as the bundles don't grow, 
+        so a list reused for all bundles doesn't allocate again.
+        Returns the number of elements taken.
+        '''
+        count = min(int(max_count), len(self))
+        if self.arrival_times is not None:
+            popleft = self.arrival_times.popleft
+            for _ in repeat(None, count):
+                popleft()
+        # overwrite the slots of the former bundle, slice assignment would create a temporary list
+        popleft = self.popleft
+        del bundle[count:]
+        for index in range(len(bundle)):
+            bundle[index] = popleft()
+        bundle.extend(starmap(popleft, repeat((), count - len(bundle))))
+        return count
+
+    def append_timed(self, item):
+        '''Appends item and stores its arrival time, queue has to track arrival times.'''
+        self.append(item)
+        self.arrival_times.append(time.monotonic())
+
+    def oldest_arrival(self):
+        '''Returns the time.monotonic() arrival time of the oldest element, 
+        None if the queue is empty or arrival times are not tracked.
+        '''
+        if self.arrival_times:
+            return self.arrival_times[0]
+        return None
@@ -22,6 +22,10 @@ class ProcessStorage stores
 import time
 import sys   
 import logging
+from itertools import repeat
+
+from .bundlestate import BundleState
+
 
 
 
@@ -33,27 +37,49 @@ class BundleRestHandler():
     max_copy_size = 100 
     '''max input items to be copied from input queue, to be set by using application, defaults to 100'''
     source_data_list = None
-    '''Reference to the source where data bundles should be read from.'''
+    '''Reference to the source where data bundles should be read from, a BundleQueue.'''
     input_list_lock = None
-    '''lock for the input queue, this lock is used by different threads acessing the queuue, to be set by using application'''
+    '''lock for the input queue, this lock is used by different threads acessing the queuue, to be set by using application
+    It is a condition, handlers wait on it until a bundle is ready or the handler is stopped.'''
+    input_list_space = None
+    '''Optional condition sharing the lock of input_list_lock, notified when data has been taken from 
+    the input queue, to be set by using application which waits on it for free queue space.
+    It has to be set together with input_list_lock.'''
+    bundle_sizer = None
+    '''Optional AdaptiveBundleSize shared by all handlers, if set its actual size is used instead of 
+    max_copy_size, which is then the upper limit, to be set by using application.'''
+    max_bundle_wait = 0.0
+    '''max time in seconds the oldest input data waits for the bundle to become full before a
+    partial bundle is taken, 0 takes any available data immediately, to be set by using application.
+    Requires source_data_list tracking the arrival times.'''
     field_mapping = None
     '''list with input data attribute to mining model field mapping'''
+    field_mapping_plan = None
+    '''FieldMappingPlan compiled once from field_mapping, to be set by using application. If not set or
+    not compiled from the actual field_mapping the handler compiles it itself.'''
     keep_data_order = True
-    '''For future use: The actual version doesn't support unordered output
-    Defines if output data shall be send in same order as input data. 
-    This has only impact if optional fields are allowed.
+    '''Defines if output data shall be send in same order as input data, to be set by using application.
+    Ordered output is written through the reorder_buffer, unordered output is written by each handler
+    as soon as its bundle is completed.
     '''
     single_output = True
     ''' Defines if all results should be written to one output or two (success,error) '''
     allow_optional_fields = False
     ''' For future use: The actual version doesn't support optional fields.
     '''
-    bundle_counter = 0
-    ''' Counter incremented by each copy of a bundle from source. Reference to an outside variable.
+    reorder_buffer = None
+    ''' ReorderBuffer shared by all handlers, it numbers the bundles when they are copied from source and
+    writes their results in this order to the output_function. If not set results are written directly.
     '''
-    next_bundle_to_sent = 0
-    ''' Number (derived from bundle_counter) of next bundle to be send. Needed in case keep_data_order = True
-    Reference to an outside variable.
+    owns_input_data = False
+    ''' Defines if the input data dicts are owned by the handler, i.e. nobody else references them, to be set 
+    by using application. Owned input data is extended in place with the result, otherwise the output 
+    data is a copy of the input data extended with the result.
+    '''
+    output_fields = None
+    ''' Tuple of the input data attributes kept in the output data next to the result, to be set by using
+    application. The output data is a new dict with these attributes, other attributes are dropped.
+    None keeps all attributes.
     '''
     output_function = None
     ''' Reference of the output function to be used. Depending on single_output setting it has to support
@@ -68,9 +94,6 @@ class BundleRestHandler():
         assert self.source_data_list is not None
         assert self.field_mapping is not None
         assert self.output_function is not None
-        #if keep_data_order:
-        #    assert self.bundle_counter is not None
-        #    assert self.next_bundle_to_send is not None
         
         #####################################################################
         # thread related members
@@ -85,11 +108,12 @@ class BundleRestHandler():
         #####################################################################
         self._data_size = 0
         self._bundle_number = None
+        # the lists are reused for all bundles, they are filled in place and not replaced by new lists
         self._data_list = []            # don't change this, this is the original data, filled by copy()
-        self._status_list = []          # processing status of several steps, if one step is not successful, next are not done
-                                        # will get same size as _data_list
+        self._bundle_state = BundleState()  # processing status of several steps, if one step is not successful, next are not done
+                                            # reused for all bundles, reset to the size of _data_list
         self._payload_list = []         # REST payload list, each element is one payload, generated by preprocess()
-        self._rest_response = []        # holds the REST response, REST errors are reflected in _status_list
+        self._rest_response = None      # holds the REST response, REST errors are reflected in _bundle_state
         self._result_list = []          # REST result list, needs to have one entry for each data being in payload, result index equals to data index 
 
 
@@ -104,7 +128,10 @@ class BundleRestHandler():
             tracer.debug("Loop: Thread %d received %d tuples.", self._handler_index, bundle_tuple_count )
             if  bundle_tuple_count > 0:
                 self.preprocess()
+                request_start = time.monotonic()
                 self.synch_rest_call()
+                if self.bundle_sizer is not None:
+                    self.bundle_sizer.record(time.monotonic() - request_start, bundle_tuple_count)
                 self.postprocess()
                 self.write_result_to_output()
                 overall_count += bundle_tuple_count
@@ -114,69 +141,128 @@ class BundleRestHandler():
             
     def stop(self):
         tracer.debug("Stopping handler: %d", self._handler_index  )
-        self._run = False
+        # wake up all waiting handlers, each checks its own run state
+        with self.input_list_lock:
+            self._run = False
+            self.input_list_lock.notify_all()
 
 
     def copy_from_source(self):        
         self._data_size = 0
         self._bundle_number = None
-        self._data_list = []            # don't change this, this is the original data, filled by copy()
-        self._status_list = []          # processing status of several steps, if one step is not successful, next are not done
-                                        # will get same size as _data_list
-        self._payload_list = []         # REST payload list, each element is one payload, generated by preprocess()
-        self._rest_response = []        # holds the REST response, REST errors are reflected in _status_list
-        self._result_list = []          # REST result list, needs to have one entry for each data being in payload, result index equals to data index 
+        self._payload_list.clear()      # REST payload list, each element is one payload, generated by preprocess()
+        self._rest_response = None      # holds the REST response, REST errors are reflected in _bundle_state
+        # _data_list, _bundle_state and _result_list are replaced in place with the next bundle
 
         # python threading is just sequential processing, staying little longer in lock doesn't matter
         with self.input_list_lock:
             
-            # wait blocking with timeout (to allow checking outer run condition) 
-            # until list has been filled
-            if not self.input_list_lock.wait_for(lambda:len(self.source_data_list) > 0 , 0.1): 
+            # wait blocking until a bundle is ready, the waiting thread is notified 
+            # on new data or by stop(), a timeout is only used to flush a
+            # partial bundle after max_bundle_wait
+            while not self._is_bundle_ready_or_stopped():
+                self.input_list_lock.wait(self._get_bundle_wait_timeout())
+            if not self._run:
+                # don't keep the last bundle's data referenced
+                self._data_list.clear()
+                self._result_list.clear()
+                self._bundle_state.reset(0)
                 return 0
         
             #determine size and copy max size or all to local data list
             input_size = len(self.source_data_list)
             #tracer.debug("ProcessStorage (%d) : source_data_list len before copy %d!", self._handler_index, input_size)
             if input_size > 0:
-                end_index = int(self.max_copy_size) if input_size >= self.max_copy_size else input_size
-                self._data_list = self.source_data_list[:end_index]
-                del self.source_data_list[:end_index]
-                self._data_size = end_index 
+                # source_data_list is a BundleQueue, taking the bundle costs O(bundle) 
+                # independent of the remaining queue length
+                self._data_size = self.source_data_list.pop_bundle_into(self._data_list, self.get_max_bundle_size())
                 #tracer.debug("ProcessStorage (%d) :  read %d tuples from input queue with _data_list len %d!", self._handler_index, end_index, len(self._data_list))
-                self._bundle_number = self.bundle_counter
-                self.bundle_counter += 1
+                # numbered while holding the lock, the numbers are in input order
+                if self.reorder_buffer is not None:
+                    self._bundle_number = self.reorder_buffer.reserve()
     
-                #create the status list at once
-                self._status_list = [{"mapping_success":False,"score_success":False,"message":None} for i in range(self._data_size)]
-                #create the result list at once
-                self._result_list = [None for i in range(self._data_size)]
+                #reset the status, no objects are created per input data
+                self._bundle_state.reset(self._data_size)
+                #reset the result list in place, slice assignment would create a temporary list
+                result_list = self._result_list
+                del result_list[self._data_size:]
+                for index in range(len(result_list)):
+                    result_list[index] = None
+                result_list.extend(repeat(None, self._data_size - len(result_list)))
                 #tracer.debug("ProcessStorage (%d) : source_data_list len after copy %d!", self._handler_index, len(self.source_data_list))
                 
-                #wake up waiting threads inclusive writing threads
-                self.input_list_lock.notify()
+                # remaining data is handed over to the next waiting handler
+                if len(self.source_data_list) > 0:
+                    self.input_list_lock.notify()
+                # wake up the writing thread in case it waits for space in the queue
+                if self.input_list_space is not None:
+                    self.input_list_space.notify()
         return self._data_size                
+
+    def get_max_bundle_size(self):
+        if self.bundle_sizer is not None:
+            return self.bundle_sizer.size
+        return self.max_copy_size
+
+    def _is_bundle_ready_or_stopped(self):
+        input_size = len(self.source_data_list)
+        if input_size >= self.get_max_bundle_size() or not self._run:
+            return True
+        if input_size == 0:
+            return False
+        if self.max_bundle_wait <= 0:
+            return True
+        oldest_arrival = self.source_data_list.oldest_arrival()
+        return oldest_arrival is None or oldest_arrival + self.max_bundle_wait <= time.monotonic()
+
+    def _get_bundle_wait_timeout(self):
+        # None waits until notified, without partial bundle there is no time limit 
+        oldest_arrival = self.source_data_list.oldest_arrival()
+        if self.max_bundle_wait <= 0 or oldest_arrival is None:
+            return None
+        return max(oldest_arrival + self.max_bundle_wait - time.monotonic(), 0.0)
         
     def get_final_data(self, single_list = True):
-        if single_list:
-            single_output = [{**data,**result} for data, result in zip(self._data_list, self._result_list)]
-            return [single_output]
+        if self.output_fields is not None:
+            final_data = [self._project(data, result) for data, result in zip(self._data_list, self._result_list)]
+        elif self.owns_input_data:
+            for data, result in zip(self._data_list, self._result_list):
+                data.update(result)
+            final_data = list(self._data_list)
         else:
-            success_output = [{**data,**result} for data, result, status in zip(self._data_list, self._result_list, self._status_list) if status["message"] is None]
-            error_output = [{**data,**result} for data, result, status in zip(self._data_list, self._result_list, self._status_list) if status["message"] is not None]
-            return [success_output, error_output]
+            final_data = [{**data,**result} for data, result in zip(self._data_list, self._result_list)]
+        if single_list:
+            return [final_data]
+        messages = self._bundle_state.messages
+        if not messages:
+            return [final_data, []]
+        # error data are the ones with a message, only these are looked up
+        error_output = [final_data[index] for index in sorted(messages)]
+        if len(error_output) == len(final_data):
+            return [[], error_output]
+        success_output = [data for index, data in enumerate(final_data) if index not in messages]
+        return [success_output, error_output]
     
+    def _project(self, data, result):
+        # attributes missing in the input data, e.g. with mapping error, are left out
+        projected = {field: data[field] for field in self.output_fields if field in data}
+        projected.update(result)
+        return projected
+
     def write_result_to_output(self):
-        while self.next_bundle_to_sent != self._bundle_number:
-            time.sleep(0.01)
-        self.output_function(self.get_final_data(single_list = self.single_output))
-        self.next_bundle_to_sent = self.next_bundle_to_sent + 1
+        if self.reorder_buffer is not None:
+            self.reorder_buffer.put(self._bundle_number, self.get_final_data(single_list = self.single_output))
+        else:
+            self.output_function(self.get_final_data(single_list = self.single_output))
     
     def get_bundle_number(self):
         return self._bundle_number
     
     def get_status(self):
-        return self._status_list
+        return self._bundle_state.get_status()
+
+    def get_bundle_state(self):
+        return self._bundle_state
 
     def get_payload(self):
         return self._payload_list
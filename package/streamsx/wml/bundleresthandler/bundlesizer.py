@@ -0,0 +1,75 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class AdaptiveBundleSize determines the bundle size used by all handlers at runtime
+
+- handlers report the round trip time of each scoring request
+- after each window of reported requests the p99 latency of the window is compared
+  to the target latency (AIMD)
+    - p99 above target: bundle size is decreased multiplicative
+    - p99 below target: bundle size is increased additive, but only if the
+      bundles of the window were full, otherwise the input rate is the limit
+      and not the bundle size
+- the bundle size is kept in the range of min_size and max_size
+
+'''
+
+import logging
+import math
+import threading
+
+tracer = logging.getLogger(__name__)
+
+
+class AdaptiveBundleSize():
+
+    def __init__(self, initial_size, min_size, max_size, target_latency,
+                       window = 20,
+                       increase_step = None,
+                       decrease_factor = 0.5):
+        '''target_latency is the p99 request latency in seconds to be reached.
+        window is the number of requests after which the size is adapted.
+        increase_step defaults to 1/20 of the min/max range, at least 1.
+        '''
+        assert 1 <= min_size <= max_size
+        assert 0 < decrease_factor < 1
+        self.min_size = int(min_size)
+        self.max_size = int(max_size)
+        self.target_latency = target_latency
+        self.window = window
+        self.increase_step = increase_step if increase_step is not None else max(1, (self.max_size - self.min_size) // 20)
+        self.decrease_factor = decrease_factor
+        self.size = min(max(int(initial_size), self.min_size), self.max_size)
+        '''actual bundle size to be used, read without lock by handlers and controller'''
+        self._lock = threading.Lock()
+        self._latencies = []
+        self._full_bundles = 0
+
+    def record(self, latency, bundle_size):
+        '''Reports the latency in seconds of a request which was sent with bundle_size input data.'''
+        with self._lock:
+            self._latencies.append(latency)
+            if bundle_size >= self.size:
+                self._full_bundles += 1
+            if len(self._latencies) < self.window:
+                return
+            p99 = self._percentile(self._latencies, 0.99)
+            if p99 > self.target_latency:
+                new_size = max(self.min_size, int(self.size * self.decrease_factor))
+            elif self._full_bundles * 2 >= len(self._latencies):
+                new_size = min(self.max_size, self.size + self.increase_step)
+            else:
+                new_size = self.size
+            if new_size != self.size:
+                tracer.debug("Bundle size changed from %d to %d, p99 latency %.3fs", self.size, new_size, p99)
+                self.size = new_size
+            self._latencies = []
+            self._full_bundles = 0
+
+    @staticmethod
+    def _percentile(values, fraction):
+        ordered = sorted(values)
+        return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
@@ -0,0 +1,88 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class BundleState holds the processing status of each input data of a bundle
+
+- mapping and scoring success are flags in bytearrays, one byte per input data
+- input data with a prediction from the ScoringCache are flagged as cached, they are
+  mapped and scored successfully but not in the payload
+- error messages are kept in a dict by input data index, only failed input data have one,
+  an input data without message is a successful one
+- a handler reuses its state for all bundles, reset() clears it without creating
+  objects per input data
+
+get_status() provides the status in the former format, a list of dicts with the keys
+"mapping_success", "score_success" and "message", it is built on each call.
+
+'''
+
+class BundleState():
+
+    __slots__ = ('size', 'mapping_success', 'score_success', 'cached', 'messages')
+
+    def __init__(self):
+        self.size = 0
+        self.mapping_success = bytearray()
+        self.score_success = bytearray()
+        self.cached = bytearray()
+        self.messages = {}
+
+    def reset(self, size):
+        '''Prepares the state for a bundle of size input data, no success and no messages.'''
+        # one temporary zero buffer for all flags, slice assignment keeps the 
+        # bytearrays' buffer as long as the bundles don't grow
+        zeros = bytes(size)
+        self.mapping_success[:] = zeros
+        self.score_success[:] = zeros
+        self.cached[:] = zeros
+        self.messages.clear()
+        self.size = size
+
+    def set_mapped(self, index):
+        self.mapping_success[index] = 1
+
+    def set_cached(self, index):
+        self.cached[index] = 1
+
+    def set_mapping_error(self, index, message):
+        self.mapping_success[index] = 0
+        self.messages[index] = message
+
+    def set_message(self, index, message):
+        self.messages[index] = message
+
+    def get_message(self, index):
+        '''The error message of the input data, None if it has no error.'''
+        return self.messages.get(index)
+
+    def get_mapped_indices(self):
+        '''Indices of the input data which are in the payload, in input order.'''
+        if 1 in self.cached:
+            return [index for index, (mapped, cached) in enumerate(zip(self.mapping_success, self.cached)) if mapped and not cached]
+        return [index for index, mapped in enumerate(self.mapping_success) if mapped]
+
+    def set_score_result(self, success, message = None):
+        '''Sets the result of the scoring request, on failure all input data without
+        an error message so far get the message, except the cached ones.'''
+        messages = self.messages
+        if success:
+            score_success = self.score_success
+            for index, mapped in enumerate(self.mapping_success):
+                # input data rejected by isolate_invalid_input have a message
+                if mapped and index not in messages:
+                    score_success[index] = 1
+        else:
+            cached = self.cached
+            self.score_success[:] = cached
+            for index in range(self.size):
+                if index not in messages and not cached[index]:
+                    messages[index] = message
+
+    def get_status(self):
+        '''The status as list of dicts, one for each input data.'''
+        get_message = self.messages.get
+        return [{"mapping_success":bool(mapped),"score_success":bool(scored),"message":get_message(index)}
+                for index, (mapped, scored) in enumerate(zip(self.mapping_success, self.score_success))]
@@ -0,0 +1,67 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class FieldMappingPlan is the field_mapping compiled once for the mapping of all input data
+
+- the tuple field values are taken with one operator.itemgetter call
+- the model fields list is the same for all input data, it is not built per input data
+- the special mapping [{"model_field":"__array__","tuple_field":"<name_of_tuple_field>"}]
+  is detected once (array_mode)
+- the failing tuple field is only searched for invalid input data
+
+The plan is immutable, it may be shared by all handlers.
+
+'''
+
+from functools import partial
+from operator import is_, itemgetter
+
+_ARRAY_FIELD_ = '__array__'
+_is_none = partial(is_, None)
+
+
+class FieldMappingPlan():
+
+    __slots__ = ('field_mapping', 'tuple_fields', 'model_fields', 'array_mode', 'always_invalid', 'get_values')
+
+    def __init__(self, field_mapping):
+        '''field_mapping is the list of mapping dicts, it is kept to detect
+        if the plan is still the one of the handler's actual field_mapping.'''
+        self.field_mapping = field_mapping
+        self.tuple_fields = tuple(field['tuple_field'] for field in field_mapping)
+        self.model_fields = [field['model_field'] for field in field_mapping]
+        array_fields = self.model_fields.count(_ARRAY_FIELD_)
+        # '__array__' has to be the only mapping, otherwise no input data can be mapped
+        self.array_mode = array_fields == 1 and len(field_mapping) == 1
+        self.always_invalid = array_fields > 0 and not self.array_mode
+        if not self.tuple_fields:
+            # itemgetter needs at least one item, an empty field_mapping maps no values
+            self.get_values = lambda _tuple: ()
+        elif len(self.tuple_fields) == 1:
+            get_value = itemgetter(self.tuple_fields[0])
+            self.get_values = lambda _tuple: (get_value(_tuple),)
+        else:
+            # returns a tuple of the values
+            self.get_values = itemgetter(*self.tuple_fields)
+
+    def map_values(self, _tuple):
+        '''Returns the tuple values in model field order, None if a field is missing or None.'''
+        try:
+            values = self.get_values(_tuple)
+        except KeyError:
+            return None
+        if self.always_invalid or any(map(_is_none, values)):
+            return None
+        return values
+
+    def get_error_field(self, _tuple):
+        '''The first tuple field of the mapping which makes the input data invalid, None without fields.'''
+        if not self.tuple_fields:
+            return None
+        for tuple_field, model_field in zip(self.tuple_fields, self.model_fields):
+            if _tuple.get(tuple_field) is None or model_field == _ARRAY_FIELD_:
+                return tuple_field
+        return self.tuple_fields[-1]
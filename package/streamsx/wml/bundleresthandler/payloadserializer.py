@@ -0,0 +1,112 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+PayloadSerializer encodes the scoring request body and decodes the scoring response
+of requests sent directly to the scoring endpoint
+
+- the fastest installed JSON library is used: orjson, ujson or the standard json module
+- numpy arrays and numpy scalars as delivered by the '__array__' mapping are serialized
+  without converting them to python lists first where the library supports it (orjson),
+  the other libraries convert them with a default hook when they are found in the payload
+- dumps() returns the UTF-8 encoded body, loads() accepts bytes as received
+
+Requests sent with the WML client are encoded by the WML client itself.
+
+'''
+
+import json
+import logging
+
+import numpy
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+tracer = logging.getLogger(__name__)
+
+
+def _numpy_default(obj):
+    '''Default hook for values the JSON library doesn't serialize by itself.'''
+    if isinstance(obj, numpy.ndarray):
+        return obj.tolist()
+    if isinstance(obj, numpy.generic):
+        return obj.item()
+    raise TypeError("Object of type " + type(obj).__name__ + " is not JSON serializable")
+
+
+class PayloadSerializer():
+    '''Standard json module, always available.'''
+    name = "json"
+
+    @staticmethod
+    def is_available():
+        return True
+
+    def dumps(self, obj):
+        return json.dumps(obj, separators = (',', ':'), default = _numpy_default).encode('utf-8')
+
+    def loads(self, data):
+        return json.loads(data)
+
+
+class OrjsonPayloadSerializer(PayloadSerializer):
+    '''orjson serializes numpy arrays and scalars natively.'''
+    name = "orjson"
+
+    @staticmethod
+    def is_available():
+        return orjson is not None
+
+    def dumps(self, obj):
+        return orjson.dumps(obj, default = _numpy_default, option = orjson.OPT_SERIALIZE_NUMPY)
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+
+class UjsonPayloadSerializer(PayloadSerializer):
+    '''ujson needs version 5.5 or higher for the default hook.'''
+    name = "ujson"
+
+    @staticmethod
+    def is_available():
+        if ujson is None:
+            return False
+        try:
+            ujson.dumps(numpy.int64(0), default = _numpy_default)
+        except TypeError:
+            return False
+        return True
+
+    def dumps(self, obj):
+        return ujson.dumps(obj, ensure_ascii = False, default = _numpy_default).encode('utf-8')
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+
+# in order of preference for "auto"
+_SERIALIZERS_ = [OrjsonPayloadSerializer, UjsonPayloadSerializer, PayloadSerializer]
+
+
+def get_serializer(name = "auto"):
+    '''Returns a serializer instance for the library name, "auto" selects the fastest installed one.
+    Raises ValueError for unknown or not installed libraries.
+    '''
+    for serializer_class in _SERIALIZERS_:
+        if name in ("auto", serializer_class.name) and serializer_class.is_available():
+            tracer.debug("Using payload serializer %s", serializer_class.name)
+            return serializer_class()
+    if name in [serializer_class.name for serializer_class in _SERIALIZERS_]:
+        raise ValueError("Payload serializer '" + name + "' needs the " + name + " package")
+    raise ValueError("Unknown payload serializer: " + str(name))
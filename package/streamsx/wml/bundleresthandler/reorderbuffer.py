@@ -0,0 +1,98 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class ReorderBuffer writes the results of the bundles to the output in the order
+the bundles were taken from the input queue
+
+- a handler reserves the sequence number of its bundle while it holds the
+  input queue lock, so the sequence is the input order
+- a handler completing a bundle puts its results with the sequence number
+- the handler putting the next expected bundle writes it to the output and all directly
+  following bundles which are already completed, so a completed bundle is written the
+  moment its predecessor is written, no handler waits or polls for its turn
+- only one handler writes at a time, the output function is not called concurrently
+
+The bundles in process are limited to a window following the next bundle to be written:
+put() waits while the bundle is window or more bundles ahead of it. A handler waiting there
+doesn't take further input data, so a stalled bundle applies back-pressure through the input
+queue. The handler of the next bundle never waits. With window set to the number of handlers
+(and slots) times _WINDOW_BUNDLES_PER_HANDLER_ the other handlers keep running for a
+while when a single request takes much longer than the others.
+
+'''
+
+import itertools
+import logging
+import threading
+
+tracer = logging.getLogger(__name__)
+
+# bundles per handler (or slot) in the window, with one bundle per handler
+# a single slow request stalls all handlers almost immediately
+_WINDOW_BUNDLES_PER_HANDLER_ = 8
+
+
+class ReorderBuffer():
+
+    def __init__(self, output_function, window = None):
+        '''window is the number of bundles which may be put ahead of the next bundle to be
+        written, None doesn't limit them.'''
+        self._output_function = output_function
+        self.window = window
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._window_moved = threading.Condition(self._lock)
+        self._pending = {}
+        self._next_sequence = 0
+        self._writing = False
+
+    def reserve(self):
+        '''Returns the sequence number for the next bundle, to be called while holding
+        the input queue lock.'''
+        return next(self._sequence)
+
+    def put(self, sequence, results):
+        '''Stores the results of the bundle with the sequence number and writes all bundles
+        which are next in sequence, unless another handler is writing them already.
+        Waits until the sequence number is within the window.'''
+        with self._lock:
+            self._window_moved.wait_for(lambda : self._is_in_window(sequence))
+            self._pending[sequence] = results
+            if self._writing:
+                return
+            self._writing = True
+        while True:
+            with self._lock:
+                if self._next_sequence not in self._pending:
+                    self._writing = False
+                    return
+                results = self._pending.pop(self._next_sequence)
+                self._next_sequence += 1
+                self._window_moved.notify_all()
+            # outside the lock, other handlers can put their results meanwhile
+            try:
+                self._output_function(results)
+            except:
+                with self._lock:
+                    self._writing = False
+                raise
+
+    def wait_for_window(self, sequence):
+        '''Waits until the sequence number is within the window, put() won't wait then.'''
+        with self._lock:
+            self._window_moved.wait_for(lambda : self._is_in_window(sequence))
+
+    def is_in_window(self, sequence):
+        with self._lock:
+            return self._is_in_window(sequence)
+
+    def _is_in_window(self, sequence):
+        return self.window is None or sequence - self._next_sequence < self.window
+
+    def get_pending_count(self):
+        '''Number of completed bundles waiting for their predecessors.'''
+        with self._lock:
+            return len(self._pending)
@@ -0,0 +1,83 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class RetryPolicy decides if and when a failed scoring request is sent again
+
+- transient failures are retried: the configured HTTP status codes (throttling 429,
+  service not available 5xx) as well as connection errors and timeouts
+- other failures, e.g. invalid input 400, are not retried
+- the delay before each retry grows exponential from backoff_base up to backoff_cap,
+  with jitter the delay is taken randomly between 0 and this value ("full jitter"),
+  so the handler threads don't retry all at the same time
+- the handler retries the request of its bundle in place, while retrying it doesn't take
+  new bundles from the input queue, so the queue fills up and applies back-pressure
+  to the input stream instead of sending the data to the error output
+
+'''
+
+import asyncio
+import logging
+import random
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+tracer = logging.getLogger(__name__)
+
+
+_RETRY_STATUS_CODES_ = (429, 500, 502, 503, 504)
+
+# connection errors and timeouts, including the ones raised by the WML client's requests
+_RETRY_EXCEPTIONS_ = (requests.exceptions.ConnectionError, requests.exceptions.Timeout, asyncio.TimeoutError)
+if aiohttp is not None:
+    _RETRY_EXCEPTIONS_ += (aiohttp.ClientConnectionError,)
+
+
+class RetryPolicy():
+
+    def __init__(self, max_attempts = 3,
+                       backoff_base = 0.1,
+                       backoff_cap = 10.0,
+                       jitter = True,
+                       retry_status_codes = None):
+        '''max_attempts is the overall number of attempts for a request, 1 disables retries.
+        backoff_base and backoff_cap are the delays in seconds before the first retry and the
+        maximum delay. retry_status_codes defaults to 429, 500, 502, 503 and 504.
+        '''
+        assert max_attempts >= 1
+        assert 0 <= backoff_base <= backoff_cap
+        self.max_attempts = int(max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.jitter = jitter
+        self.retry_status_codes = frozenset(retry_status_codes if retry_status_codes is not None else _RETRY_STATUS_CODES_)
+
+    def is_retryable(self, err, status_code):
+        '''True if the request failed with a transient error. status_code is the HTTP status
+        of the response rejecting the request, None if there was no response.'''
+        if status_code is not None:
+            return status_code in self.retry_status_codes
+        return isinstance(err, _RETRY_EXCEPTIONS_)
+
+    def get_delay(self, attempt):
+        '''Delay in seconds before the retry following the failed attempt (counted from 1).'''
+        delay = min(self.backoff_cap, self.backoff_base * (2 ** (attempt - 1)))
+        if self.jitter:
+            return random.uniform(0, delay)
+        return delay
+
+    def should_retry(self, err, status_code, attempt):
+        '''Returns the delay before the next attempt or None if the failed attempt is not retried.'''
+        if attempt >= self.max_attempts or not self.is_retryable(err, status_code):
+            return None
+        delay = self.get_delay(attempt)
+        tracer.warning("Scoring request attempt %d failed with %s, retry in %.3fs",
+                       attempt, str(status_code) if status_code is not None else type(err).__name__, delay)
+        return delay
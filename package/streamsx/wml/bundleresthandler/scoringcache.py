@@ -0,0 +1,128 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class ScoringCache holds the predictions of already scored input data
+
+- the key is the mapped values row, as sent in the scoring payload, plus the deployment_guid,
+  input data with the same mapped values get the same prediction without scoring them again
+- the cache is limited to max_size entries, the least recently used entry is removed first
+- with ttl an entry is only used for ttl seconds after it was stored
+- the entries are removed when the model version of the deployment changes, the handlers
+  get the deployment details every version_check_interval seconds
+- hits and misses are counted
+
+The cache is shared by all handlers, lookup() and store() take the entries of a bundle
+with one lock.
+
+'''
+
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+import numpy
+
+tracer = logging.getLogger(__name__)
+
+
+class ScoringCache():
+
+    def __init__(self, max_size = 10000, ttl = None, version_check_interval = 60.0):
+        '''max_size is the maximum number of cached predictions, ttl the time in seconds a prediction
+        is used, None without time limit. version_check_interval is the time in seconds between
+        the checks of the deployment's model version, None disables the checks.
+        '''
+        assert max_size > 0
+        self.max_size = int(max_size)
+        self.ttl = ttl
+        self.version_check_interval = version_check_interval
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._model_version = None
+        # first check before the first lookup
+        self._next_version_check = 0.0
+
+    @staticmethod
+    def make_key(deployment_guid, row):
+        '''The key of a mapped values row, None if the row can't be cached (unhashable values).'''
+        if isinstance(row, numpy.ndarray):
+            return (deployment_guid, row.dtype.str, row.shape, row.tobytes())
+        key = (deployment_guid, tuple(row))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def lookup(self, keys):
+        '''Returns the cached prediction for each key, None for the ones not cached.'''
+        now = time.monotonic() if self.ttl is not None else None
+        entries = self._entries
+        predictions = []
+        with self._lock:
+            for key in keys:
+                entry = entries.get(key) if key is not None else None
+                if entry is not None and (now is None or entry[1] > now):
+                    entries.move_to_end(key)
+                    predictions.append(entry[0])
+                    continue
+                if entry is not None:
+                    del entries[key]
+                predictions.append(None)
+            hit_count = len(predictions) - predictions.count(None)
+            self.hits += hit_count
+            self.misses += len(predictions) - hit_count
+        return predictions
+
+    def store(self, items):
+        '''Stores the (key, prediction) items, the least recently used entries are removed
+        if the cache gets larger than max_size.'''
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else None
+        entries = self._entries
+        with self._lock:
+            for key, prediction in items:
+                entries[key] = (prediction, expiry)
+                entries.move_to_end(key)
+            while len(entries) > self.max_size:
+                entries.popitem(last = False)
+
+    def invalidate(self):
+        '''Removes all cached predictions.'''
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def is_version_check_due(self):
+        '''True for the one caller which has to check the model version now.'''
+        if self.version_check_interval is None:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_version_check:
+                return False
+            self._next_version_check = now + self.version_check_interval
+            return True
+
+    def set_model_version(self, version):
+        '''Sets the actual model version of the deployment, the cached predictions of
+        another model version are removed.'''
+        with self._lock:
+            changed = self._model_version is not None and version != self._model_version
+            self._model_version = version
+        if changed:
+            tracer.info("Model version of the deployment changed, scoring cache invalidated")
+            self.invalidate()
+
+    def get_statistics(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses, "invalidations": self.invalidations}
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,221 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class WmlAsyncBundleRestHandler is the asyncio variant of WmlBundleRestHandler
+
+- one handler runs one thread with an event loop
+- the handler keeps up to max_in_flight bundles in process, each bundle is
+  processed by an own handler instance (slot) sharing the thread's event loop
+- scoring requests are sent non-blocking with aiohttp directly to the
+  scoring endpoint, resolved once by the controller
+- bundles are taken from the input queue by a single helper thread per
+  event loop, as the input queue is shared with the other threads
+- mapping and result processing are the same as for WmlBundleRestHandler
+
+So the number of concurrent scoring requests is threads * max_in_flight
+without the need of a thread per request.
+
+'''
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import ssl
+import sys
+import time
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from .wmlbundleresthandler import WmlBundleRestHandler
+from .wmlscoringendpoint import WmlScoringError
+
+tracer = logging.getLogger(__name__)
+logger = logging.getLogger("com.ibm.streams.log")
+
+
+class WmlAsyncBundleRestHandler(WmlBundleRestHandler):
+
+    ########################################
+    # public controllable class varibales
+    ########################################
+    max_in_flight = 8
+    ''' Number of bundles processed concurrently by one handler thread '''
+
+
+    def __init__(self, handler_index, owner = None):
+        '''The handler created by the controller (owner None) creates the additional
+        slot instances for the concurrent bundles.
+        '''
+        super().__init__(handler_index)
+        self._slots = []
+        if owner is None:
+            self._slots = [self] + [type(self)(handler_index, owner = self) for _ in range(self.max_in_flight - 1)]
+
+
+    @staticmethod
+    def is_available():
+        '''The handler needs the optional aiohttp package.'''
+        return aiohttp is not None
+
+
+    def run(self):
+        tracer.debug("Starting async handler: %d with %d slots", self._handler_index, len(self._slots))
+        loop = asyncio.new_event_loop()
+        try:
+            overall_count = loop.run_until_complete(self._run_slots())
+        finally:
+            loop.close()
+        tracer.info("Handler %d stopped after %d records", self._handler_index, overall_count)
+
+
+    def stop(self):
+        for slot in self._slots:
+            if slot is not self:
+                slot.stop()
+        super().stop()
+
+
+    async def _run_slots(self):
+        # one thread taking the bundles from input queue for all slots
+        executor = ThreadPoolExecutor(max_workers = 1)
+        copy_lock = asyncio.Lock()
+        connector = aiohttp.TCPConnector(limit = len(self._slots), ssl = self._get_ssl_argument())
+        try:
+            async with aiohttp.ClientSession(connector = connector, timeout = self._get_client_timeout()) as session:
+                counts = await asyncio.gather(*[slot._run_slot(session, copy_lock, executor) for slot in self._slots])
+        finally:
+            executor.shutdown(wait = False)
+        return sum(counts)
+
+
+    def _get_client_timeout(self):
+        # same (connect, read) timeouts as the synchronous requests, no limit for the whole request
+        if self.request_timeout is None:
+            return aiohttp.ClientTimeout(total = None)
+        connect, read = self.request_timeout
+        return aiohttp.ClientTimeout(total = None, sock_connect = connect, sock_read = read)
+
+
+    def _get_ssl_argument(self):
+        # aiohttp: None is default verification, False disables it
+        verify = self.scoring_endpoint.verify
+        if verify is True:
+            return None
+        if verify is False:
+            return False
+        return ssl.create_default_context(cafile = verify)
+
+
+    async def _run_slot(self, session, copy_lock, executor):
+        loop = asyncio.get_running_loop()
+        overall_count = 0
+        while self._run:
+            async with copy_lock:
+                bundle_tuple_count = await loop.run_in_executor(executor, self.copy_from_source)
+            if  bundle_tuple_count > 0:
+                self.preprocess()
+                request_start = time.monotonic()
+                await self.asynch_rest_call(session)
+                if self.bundle_sizer is not None:
+                    self.bundle_sizer.record(time.monotonic() - request_start, bundle_tuple_count)
+                self.postprocess()
+                # put() would block the loop and with it the slot holding the next bundle
+                reorder_buffer = self.reorder_buffer
+                if reorder_buffer is not None and not reorder_buffer.is_in_window(self._bundle_number):
+                    await loop.run_in_executor(None, reorder_buffer.wait_for_window, self._bundle_number)
+                self.write_result_to_output()
+                overall_count += bundle_tuple_count
+        return overall_count
+
+
+    async def asynch_rest_call(self, session):
+        rest_success = True
+        error_message = None
+        error_status = None
+
+        try:
+            if len(self._payload_list) > 0:
+                self._rest_response = await self._score_async(session, self._payload_list)
+        except WmlScoringError as err:
+            # same as WMLClientError for the synchronous call, the whole bundle is rejected
+            tracer.error("WML scoring error description: %s",str(err.args[0]))
+            logger.error("WMLOnlineScoring: WML scoring error: %s",str(err.args[0]))
+            rest_success = False
+            error_message = str(err.args[0])
+            error_status = err.status_code
+        except:
+            tracer.error("Unknown exception: %s", str(sys.exc_info()[0]))
+            logger.error("WMLOnlineScoring: Unknown exception: %s", str(sys.exc_info()[0]))
+            rest_success = False
+            error_message = str(sys.exc_info()[0])
+
+        if error_status == 400 and self.isolate_invalid_input:
+            rest_success = await self._isolate_invalid_input_async(session, error_message)
+
+        return self._set_rest_status(rest_success, error_message)
+
+
+    async def _isolate_invalid_input_async(self, session, error_message):
+        '''Same as _isolate_invalid_input() of the synchronous call, the halves are scored one after
+        the other to keep the number of requests of the slot.
+        '''
+        combination = self._payload_list[0]
+        if len(combination['values']) < 2:
+            return False
+        scored = []
+        pending = deque(self._split_rows(0, combination['values']))
+        max_requests = self._get_isolation_max_requests(len(combination['values']))
+        request_count = split_count = 0
+        while pending and self._continue_isolation(pending, request_count, split_count, max_requests, error_message):
+            offset, rows = pending.popleft()
+            request_count += 1
+            try:
+                response = await self._score_async(session, [dict(combination, values = rows)])
+            except WmlScoringError as err:
+                halves = self._split_or_reject(offset, rows, err)
+                split_count += len(halves) > 0
+                pending.extend(halves)
+            except:
+                self._reject_rows(offset, rows, str(sys.exc_info()[0]))
+            else:
+                scored.append((offset, response))
+        return self._set_isolated_response(scored)
+
+
+    async def _score_async(self, session, payload_list):
+        '''Same as _score() of the synchronous call, the retry delay doesn't block the other slots.'''
+        attempt = 1
+        while True:
+            try:
+                return await self._post_payload_async(session, payload_list)
+            except Exception as err:
+                delay = self._get_retry_delay(err, attempt)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+    async def _post_payload_async(self, session, payload_list):
+        endpoint = self.scoring_endpoint
+        headers = endpoint.headers
+        body, content_headers = self._encode_payload(payload_list)
+        for attempt in range(2):
+            async with session.post(endpoint.url,
+                                    params = endpoint.params,
+                                    headers = dict(headers, **content_headers),
+                                    data = body) as response:
+                # token may have expired, get new headers once
+                if response.status == 401 and attempt == 0:
+                    headers = endpoint.refresh_headers(headers)
+                    continue
+                if response.status != 200:
+                    raise WmlScoringError("Scoring request failed with status " + str(response.status) + ": " + await response.text(), response.status)
+                return self.serializer.loads(await response.read())
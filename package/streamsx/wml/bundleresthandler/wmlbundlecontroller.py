@@ -6,7 +6,13 @@
 
 # Bundle
 from .wmlbundleresthandler import WmlBundleRestHandler
+from .wmlasyncbundleresthandler import WmlAsyncBundleRestHandler
+from .wmlscoringendpoint import WmlScoringEndpoint
+from .payloadserializer import get_serializer
+from .retrypolicy import RetryPolicy
+from .scoringcache import ScoringCache
 from .bundlecontroller import BundleController
+from .reorderbuffer import _WINDOW_BUNDLES_PER_HANDLER_
 
 # WML specific imports
 from ibm_watson_machine_learning import APIClient
@@ -18,6 +24,7 @@ import time
 import threading
 import pickle
 import sys
+import requests
 
 
 #define tracer and logger
@@ -30,6 +37,24 @@ class WmlBundleController(BundleController):
     def __init__(self, deployment_guid = None, 
                        wml_credentials = None, 
                        space_guid = None, 
+                       engine = "sync",
+                       max_in_flight = 8,
+                       transport = "client",
+                       compression_threshold = None,
+                       serializer = "auto",
+                       connect_timeout_ms = 10000,
+                       read_timeout_ms = 60000,
+                       isolate_invalid_input = False,
+                       numeric_input = False,
+                       prediction_format = "dict",
+                       retry_max_attempts = 1,
+                       retry_backoff_ms = 100,
+                       retry_backoff_cap_ms = 10000,
+                       retry_jitter = True,
+                       retry_status_codes = None,
+                       cache_size = 0,
+                       cache_ttl_ms = 0,
+                       cache_version_check_ms = 60000,
                        **kwargs
                        ):
 
@@ -38,8 +63,18 @@ class WmlBundleController(BundleController):
         ######################################################
         # initialize the controller base class with arguments 
         # and add the handler class to be used
+        # "sync": each thread sends one request at a time
+        # "async": each thread sends max_in_flight requests 
+        #          concurrently from an event loop
         ######################################################
-        kwargs["handler_class"] = WmlBundleRestHandler
+        if engine == "async":
+            if not WmlAsyncBundleRestHandler.is_available():
+                raise ImportError("WML online scoring engine 'async' needs the aiohttp package")
+            kwargs["handler_class"] = WmlAsyncBundleRestHandler
+        elif engine == "sync":
+            kwargs["handler_class"] = WmlBundleRestHandler
+        else:
+            raise ValueError("Unknown engine: " + str(engine))
         super().__init__(**kwargs)
         ######################################################
         # initialize this controller sub class with its own
@@ -58,11 +93,76 @@ class WmlBundleController(BundleController):
         #tracer.debug("Handler class: ", self._handler_class)
         self._handler_class.wml_client = self._create_wml_client()
         self._handler_class.deployment_guid = self._deployment_guid 
+        self._handler_class.isolate_invalid_input = isolate_invalid_input
+        self._handler_class.numeric_input = numeric_input
+        self._handler_class.prediction_format = prediction_format
+        self._handler_class.prediction_fields = None
+        # a single attempt doesn't need a policy
+        self._handler_class.retry_policy = None
+        if retry_max_attempts > 1:
+            self._handler_class.retry_policy = RetryPolicy(max_attempts = retry_max_attempts,
+                                                           backoff_base = retry_backoff_ms / 1000.0,
+                                                           backoff_cap = retry_backoff_cap_ms / 1000.0,
+                                                           jitter = retry_jitter,
+                                                           retry_status_codes = retry_status_codes)
+        # predictions of already scored values, shared by all handlers
+        self._scoring_cache = None
+        if cache_size > 0:
+            self._scoring_cache = ScoringCache(max_size = cache_size,
+                                               ttl = cache_ttl_ms / 1000.0 if cache_ttl_ms > 0 else None,
+                                               version_check_interval = cache_version_check_ms / 1000.0 if cache_version_check_ms > 0 else None)
+        self._handler_class.scoring_cache = self._scoring_cache
+        ######################################################
+        # the async engine and transport "direct" send the
+        # requests directly to the scoring endpoint 
+        # resolved once here, "client" uses the WML client
+        # for each request
+        ######################################################
+        # a former controller may have set the class variables 
+        # for requests sent directly, "client" doesn't use them
+        self._handler_class.scoring_endpoint = None
+        self._handler_class.scoring_session = None
+        self._handler_class.compression_threshold = None
+        self._handler_class.serializer = get_serializer()
+        self._handler_class.request_timeout = None
+        if engine == "async" or transport == "direct":
+            self._handler_class.scoring_endpoint = WmlScoringEndpoint(self._handler_class.wml_client, self._deployment_guid)
+        if engine == "async":
+            self._handler_class.max_in_flight = max_in_flight
+            # each slot holds a bundle like a handler
+            if self._reorder_buffer is not None:
+                self._reorder_buffer.window = self._threads_per_node * self._node_count * max_in_flight * _WINDOW_BUNDLES_PER_HANDLER_
+        elif transport == "direct":
+            self._handler_class.scoring_session = self._create_scoring_session()
+        elif transport != "client":
+            raise ValueError("Unknown transport: " + str(transport))
+        # only requests sent directly can be compressed,
+        # use the payload serializer and a request timeout
+        if engine == "async" or transport == "direct":
+            self._handler_class.compression_threshold = compression_threshold
+            self._handler_class.serializer = get_serializer(serializer)
+            # 0 waits without limit
+            self._handler_class.request_timeout = (connect_timeout_ms / 1000.0 if connect_timeout_ms > 0 else None,
+                                                   read_timeout_ms / 1000.0 if read_timeout_ms > 0 else None)
 
         tracer.debug("__init__ finished")
         return
 
 
+    def finish(self):
+        result = super().finish()
+        if self._scoring_cache is not None:
+            tracer.info("Scoring cache statistics: %s", str(self._scoring_cache.get_statistics()))
+        return result
+
+
+    def get_cache_statistics(self):
+        '''Size, hits, misses and invalidations of the scoring cache, None without cache.'''
+        if self._scoring_cache is None:
+            return None
+        return self._scoring_cache.get_statistics()
+
+
     def _change_deployment_node_number(self):
         return
 
@@ -71,6 +171,16 @@ class WmlBundleController(BundleController):
         return
 
     
+    def _create_scoring_session(self):
+        # keep-alive connections, one for each sending thread
+        pool_size = self._threads_per_node * self._node_count
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections = 1, pool_maxsize = pool_size)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        tracer.debug("Scoring session created with pool size %d", pool_size)
+        return session
+
     def _create_wml_client(self):
         tracer.debug("Creating WML client")
         wml_client = APIClient(self._wml_credentials)
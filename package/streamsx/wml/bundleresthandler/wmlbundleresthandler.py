@@ -6,15 +6,34 @@
 from ibm_watson_machine_learning import APIClient
 from ibm_watson_machine_learning.wml_client_error import WMLClientError
 
+import array
+from collections import deque
+from functools import lru_cache
+from itertools import chain
+import gzip
 import logging
+import sys
+import time
 import numpy   
 tracer = logging.getLogger(__name__)   
 logger = logging.getLogger("com.ibm.streams.log")   
 
 from .bundleresthandler import BundleRestHandler   
+from .wmlscoringendpoint import WmlScoringError
+from .payloadserializer import get_serializer
+from .fieldmappingplan import FieldMappingPlan
    
    
 _STREAMSX_MAPPING_ERROR_ = "Mapping error: "
+_JSON_HEADERS_ = {"Content-Type": "application/json", "Accept-Encoding": "gzip"}
+_GZIP_HEADERS_ = {"Content-Type": "application/json", "Accept-Encoding": "gzip", "Content-Encoding": "gzip"}
+_NUMERIC_TYPES_ = (int, float, numpy.integer, numpy.floating)
+
+
+@lru_cache(maxsize = None)
+def _is_numeric_type(value_type):
+    # None is a missing value, bool is an int but the regular mapping sends it as JSON boolean
+    return value_type is type(None) or (value_type is not bool and issubclass(value_type, _NUMERIC_TYPES_))
    
 class WmlBundleRestHandler(BundleRestHandler):
 
@@ -23,10 +42,45 @@ class WmlBundleRestHandler(BundleRestHandler):
     ########################################
     wml_client = None
     deployment_guid = None
+    scoring_endpoint = None
+    ''' WmlScoringEndpoint, needed if requests are sent directly and not with wml_client '''
+    scoring_session = None
+    ''' requests.Session with connection pool, if set requests are sent directly to scoring_endpoint
+    instead of using wml_client '''
+    compression_threshold = None
+    ''' Request body size in bytes from which on requests sent directly to scoring_endpoint are gzip 
+    compressed, None disables compression '''
+    request_timeout = None
+    ''' (connect, read) timeouts in seconds of requests sent directly to scoring_endpoint, None or 
+    a None element waits without limit. A timeout raises requests.Timeout, which can be retried '''
+    serializer = get_serializer()
+    ''' PayloadSerializer used for requests sent directly to scoring_endpoint and their responses '''
+    isolate_invalid_input = False
+    ''' If a bundle is rejected as invalid (400) it is split recursively into halves which are scored
+    separately, until the rejected input data are isolated. Only those get a PredictionError. '''
+    numeric_input = False
+    ''' If True all mapped fields are expected to be numeric, the values of a bundle are mapped into
+    one 2-dimensional float64 numpy.ndarray and missing values (None and NaN) are detected vectorized.
+    Bundles with non numeric values, including numeric strings and bools, are mapped as usual. '''
+    retry_policy = None
+    ''' RetryPolicy for scoring requests failing with transient errors, None disables retries '''
+    prediction_format = "dict"
+    ''' "dict": the Prediction of an input data is a dict of prediction field names and values,
+    "values": the Prediction is the list of values in the order of prediction_fields, the field
+    names are not repeated in each result '''
+    prediction_fields = None
+    ''' Tuple of the prediction field names of the "values" format, set by the handlers from the 
+    scoring responses, shared by all handlers and logged when it is set or changes '''
+    scoring_cache = None
+    ''' ScoringCache shared by all handlers, input data with cached mapped values get the cached
+    prediction and are not sent for scoring, None disables caching '''
         
         
     def __init__(self,handler_index):
         super().__init__(handler_index)
+        self._own_field_mapping_plan = None
+        self._cache_hits = {}           # input data index -> cached prediction
+        self._cache_keys = {}           # input data index -> cache key, for input data in the payload
 
         
     def preprocess(self):
@@ -68,118 +122,182 @@ class WmlBundleRestHandler(BundleRestHandler):
 
         # keep this assert as long as we don't support optional fields
         assert self.allow_optional_fields is False
+
+        #########################################################
+        # the field mapping is compiled once, all valid tuples 
+        # have the same fields as optional fields are not 
+        # supported, so there is one fields/values combination
+        #########################################################
+        plan = self._get_field_mapping_plan()
+        values = None
+        if plan.array_mode:
+            values = self._map_array_values(plan)
+        elif self.numeric_input and not plan.always_invalid:
+            values = self._map_numeric_values(plan)
+        if values is None:
+            values = self._map_field_values(plan)
+        self._cache_hits.clear()
+        if self.scoring_cache is not None:
+            values = self._take_cached_predictions(values)
         
         # clear payload list
-        self._payload_list = []      
-        actual_input_combination ={'fields':[],'values':[]}
-        
+        self._payload_list.clear()
+        if len(values) > 0:
+            # no fields element for single array as input 
+            if plan.array_mode:
+                self._payload_list.append({'values':values})
+            else:
+                self._payload_list.append({'fields':plan.model_fields,'values':values})
+
+
+    def _get_field_mapping_plan(self):
+        """The plan compiled by the controller, or an own one if field_mapping was changed."""
+        plan = self.field_mapping_plan
+        if plan is None or plan.field_mapping is not self.field_mapping:
+            plan = self._own_field_mapping_plan
+            if plan is None or plan.field_mapping is not self.field_mapping:
+                plan = self._own_field_mapping_plan = FieldMappingPlan(self.field_mapping)
+        return plan
+
+
+    def _map_field_values(self, plan):
+        """The normal case, multiple mapping entries and using field names."""
+        values = []
+        map_values = plan.map_values
         for index,_tuple in enumerate(self._data_list):
-            ###################################
-            # field names and values from tuple
-            # handling fields names is already preparation
-            # for optional field support and resulting
-            # different payload content
-            ###################################
-            tuple_values = []
-            tuple_fields = []
-            tuple_error = ""
-            tuple_is_valid = True
-            for field in self.field_mapping:
-                if field['tuple_field'] in _tuple and _tuple[field['tuple_field']] is not None:
-                    tuple_field_value = _tuple[field['tuple_field']]
-                    # Handle the case that a single numpy array / List is the scoring input 
-                    # special mapping '__array__'has to be the only mapping
-                    # no field name used, ndarray needs 
-                    if field['model_field'] == '__array__':
-                        if isinstance(tuple_field_value, numpy.ndarray) and len(self.field_mapping) is 1:
-                            tuple_values = list(tuple_field_value)
-                            break
-                        elif isinstance(tuple_field_value, list)  and len(self.field_mapping) is 1:
-                            tuple_values = tuple_field_value
-                            break
-                        else:
-                            tuple_is_valid = False
-                            break
-                    # the normal case, multiple mapping entries and using field name 
-                    # tuple field value
-                    else:
-                        tuple_values.append(tuple_field_value)
-                        tuple_fields.append(field['model_field'])
-
-                #########################################################
-                # optional fields are actually not supported
-                # uncomment next prepared code lines in case we support 
-                # it in all code parts
-                #########################################################
-                #elif self.allow_optional_fields:
-                #    if field['is_mandatory']:
-                #        tuple_is_valid = False
-                #        break
-                
-                else:
-                    tuple_is_valid = False
-                    break
-
-            if not tuple_is_valid:            
-                tuple_error = "input field: " + field['tuple_field']
-
-            ######################
-            # store tuple status
-            ######################
-            if tuple_is_valid: 
-                self._status_list[index]["mapping_success"] = True
+            tuple_values = map_values(_tuple)
+            if tuple_values is None:
+                self._set_mapping_error(index, plan.get_error_field(_tuple))
             else:
-                self._status_list[index]["mapping_success"] = False
-                self._status_list[index]["message"] = _STREAMSX_MAPPING_ERROR_ + tuple_error
-                continue            
+                self._bundle_state.set_mapped(index)
+                values.append(list(tuple_values))
+        return values
 
-            
-            #######################
-            # add payload for tuple
-            #######################    
-            if actual_input_combination['fields'] == tuple_fields:
-                #same fields as before, just add further values
-                actual_input_combination['values'].append(list(tuple_values))
-            elif len(actual_input_combination['values']) is 0:  
-                # first tuple
-                actual_input_combination['fields']=tuple_fields
-                actual_input_combination['values']=[list(tuple_values)]
+
+    def _map_numeric_values(self, plan):
+        """All fields numeric, the values are one block of the bundle, only the valid
+        rows are taken. Returns None if there are values which are not numeric, e.g. numeric 
+        strings or bools, which float64 would convert."""
+        get_values = plan.get_values
+        missing_row = (None,) * len(plan.tuple_fields)
+        rows = []
+        for _tuple in self._data_list:
+            try:
+                rows.append(get_values(_tuple))
+            except KeyError:
+                rows.append(missing_row)
+        # the types are checked once for each distinct type of the bundle's values
+        if not all(map(_is_numeric_type, set(map(type, chain.from_iterable(rows))))):
+            return None
+        try:
+            # None gets NaN
+            block = numpy.array(rows, dtype = numpy.float64)
+        except (ValueError, TypeError):
+            return None
+        missing = numpy.isnan(block)
+        valid = ~missing.any(axis = 1)
+        set_mapped = self._bundle_state.set_mapped
+        for index in numpy.flatnonzero(valid):
+            set_mapped(index)
+        for index in numpy.flatnonzero(~valid):
+            # first missing field
+            self._set_mapping_error(index, plan.tuple_fields[missing[index].argmax()])
+        return block[valid]
+
+
+    def _map_array_values(self, plan):
+        """Handle the case that a single numpy array / List is the scoring input,
+        no field name used. array.array and bytes (uint8) buffers are taken as
+        numpy array without copy."""
+        rows = []
+        tuple_field = plan.tuple_fields[0]
+        for index,_tuple in enumerate(self._data_list):
+            tuple_field_value = _tuple.get(tuple_field)
+            if isinstance(tuple_field_value, (numpy.ndarray, list)):
+                rows.append(tuple_field_value)
+            elif isinstance(tuple_field_value, (array.array, bytes, bytearray)) and self._is_numeric_buffer(tuple_field_value):
+                rows.append(numpy.frombuffer(tuple_field_value, dtype = getattr(tuple_field_value, 'typecode', numpy.uint8)))
+            else:
+                self._set_mapping_error(index, tuple_field)
+                continue
+            self._bundle_state.set_mapped(index)
+        return self._stack_rows(rows)
+
+
+    @staticmethod
+    def _is_numeric_buffer(value):
+        # unicode array.array can't be scored
+        return getattr(value, 'typecode', 'B') != 'u'
+
+
+    @staticmethod
+    def _stack_rows(rows):
+        """One dimensional numpy rows of same length are stacked into one 2-dimensional array,
+        which is serialized without creating a Python object for each value.
+        Otherwise the rows are taken as lists."""
+        if rows and all(isinstance(row, numpy.ndarray) and row.ndim == 1 for row in rows):
+            if len(set(row.shape for row in rows)) == 1:
+                return numpy.stack(rows)
+        return [row.tolist() if isinstance(row, numpy.ndarray) else row for row in rows]
+
+
+    def _take_cached_predictions(self, values):
+        """Looks up the mapped values rows in the scoring_cache, the input data of cached rows get
+        their prediction from the cache. Returns the rows which are not cached, they are scored."""
+        cache = self.scoring_cache
+        self._cache_keys.clear()
+        if cache.is_version_check_due():
+            self._check_model_version()
+        indices = self._bundle_state.get_mapped_indices()
+        keys = [cache.make_key(self.deployment_guid, row) for row in values]
+        not_cached = []
+        for index, key, prediction in zip(indices, keys, cache.lookup(keys)):
+            if prediction is None:
+                not_cached.append(True)
+                if key is not None:
+                    self._cache_keys[index] = key
             else:
-                tuple_is_valid = False
-                tuple_error = " optional fields are not allowed"
-                # following code is preparation for support of multiple field combinations
-                # in case of supported optional fields
-                #
-                #close and store last fields/values combination in final _payload_list
-                #except for the first valid tuple being added
-                #if len(actual_input_combination['values']) > 0 : self._payload_list.append(actual_input_combination) 
-                ##create new field/value combination
-                #actual_input_combination['fields']=tuple_fields
-                #actual_input_combination['values']=[list(tuple_values)]
-
-                        
-        #after last tuple store the open field/value combination finally in payload_list
-        if len(actual_input_combination['values']) > 0:
-            # remove empty fields element resulting from single array as input 
-            if len(actual_input_combination['fields']) is 0:
-                actual_input_combination.pop('fields')
-            self._payload_list.append(actual_input_combination)
+                not_cached.append(False)
+                self._bundle_state.set_cached(index)
+                self._cache_hits[index] = prediction
+        if not self._cache_hits:
+            return values
+        if isinstance(values, numpy.ndarray):
+            return values[numpy.array(not_cached, dtype = bool)]
+        return [row for row, scored in zip(values, not_cached) if scored]
+
+
+    def _check_model_version(self):
+        """The model version is the model asset (id and revision) of the deployment."""
+        try:
+            details = self.wml_client.deployments.get_details(self.deployment_guid)
+            version = details['entity'].get('asset')
+        except Exception as err:
+            tracer.warning("Model version of the deployment not available: %s", str(err))
+            return
+        self.scoring_cache.set_model_version(version)
+
+
+    def _set_mapping_error(self, index, tuple_field):
+        self._bundle_state.set_mapping_error(index, _STREAMSX_MAPPING_ERROR_ + "input field: " + tuple_field)
     
     
     def synch_rest_call(self):
         rest_success = True
         error_message = None
+        error_status = None
         
         try:
             if len(self._payload_list) > 0:
-                self._rest_response = self.wml_client.deployments.score(self.deployment_guid,meta_props={'input_data':self._payload_list})
-        except WMLClientError as err:
+                self._rest_response = self._score(self._payload_list)
+        except (WMLClientError, WmlScoringError) as err:
             """REST request returns 
             400 incase something with the value of 'input_data' is not correct
             404 if the deployment GUID doesn't exists as REST endpoint
                     
             score() function throws in this case an wml_client_error.WMLClientError exception
             with two args: description [0] and the response [1]
+            _post_payload() throws WmlScoringError with description [0] and status code [1]
             use response.status_code, response.json()["errors"][0]["code"], response.json()["errors"][0]["message"]
                    
             The complete payload is rejected in this case, no single element is referenced to be faulty
@@ -198,26 +316,207 @@ class WmlBundleRestHandler(BundleRestHandler):
             #because the predictioon for whole bundle failed, the complete local_list is invalid
             rest_success = False
             error_message = str(err.args[0])
+            error_status = self._get_error_status(err)
         except:
             tracer.error("Unknown exception: %s", str(sys.exc_info()[0]))
             logger.error("WMLOnlineScoring: Unknown exception: %s", str(sys.exc_info()[0]))
             #because the predictioon for whole bundle failed, the complete local_list is invalid
             rest_success = False
             error_message = str(sys.exc_info()[0])
+
+        if error_status == 400 and self.isolate_invalid_input:
+            rest_success = self._isolate_invalid_input(error_message)
             
+        return self._set_rest_status(rest_success, error_message)
+
+
+    def _score(self, payload_list):
+        """Sends the scoring request for the payload_list and returns the response,
+        raises WMLClientError or WmlScoringError if the request is rejected.
+        Requests failing with transient errors are retried according to the retry_policy.
+        """
+        attempt = 1
+        while True:
+            try:
+                return self._send_request(payload_list)
+            except Exception as err:
+                delay = self._get_retry_delay(err, attempt)
+                if delay is None:
+                    raise
+            time.sleep(delay)
+            attempt += 1
+
+
+    def _get_retry_delay(self, err, attempt):
+        """Delay before the next attempt, None if not retried. No retries after stop()."""
+        if self.retry_policy is None or not self._run:
+            return None
+        return self.retry_policy.should_retry(err, self._get_error_status(err), attempt)
+
+
+    def _send_request(self, payload_list):
+        if self.scoring_session is not None:
+            return self._post_payload(payload_list)
+        return self.wml_client.deployments.score(self.deployment_guid,meta_props={'input_data':payload_list})
+
+
+    @staticmethod
+    def _get_error_status(err):
+        """HTTP status code of a rejected scoring request, None if unknown."""
+        status_code = getattr(err, 'status_code', None)
+        if status_code is None:
+            # WML client ApiRequestFailure holds the response
+            status_code = getattr(getattr(err, 'response', None), 'status_code', None)
+        return status_code
+
+
+    def _isolate_invalid_input(self, error_message):
+        """Scores the halves of a rejected bundle recursively until the invalid input data
+        are isolated, which costs O(k log n) requests for k invalid of n input data.
+        The responses of the accepted parts are merged into one response, the rejected
+        input data get their error message in the bundle state.
+        The number of requests is limited, see _continue_isolation(), input data not isolated
+        get the error_message of the bundle.
+        Returns True if any input data was scored.
+        """
+        combination = self._payload_list[0]
+        # the bundle as whole was already rejected, a single input data can't be split
+        if len(combination['values']) < 2:
+            return False
+        scored = []
+        # breadth first, the halves of the bundle are scored first, then the quarters
+        pending = deque(self._split_rows(0, combination['values']))
+        max_requests = self._get_isolation_max_requests(len(combination['values']))
+        request_count = split_count = 0
+        while pending and self._continue_isolation(pending, request_count, split_count, max_requests, error_message):
+            offset, rows = pending.popleft()
+            request_count += 1
+            try:
+                response = self._score([dict(combination, values = rows)])
+            except (WMLClientError, WmlScoringError) as err:
+                halves = self._split_or_reject(offset, rows, err)
+                split_count += len(halves) > 0
+                pending.extend(halves)
+            except:
+                self._reject_rows(offset, rows, str(sys.exc_info()[0]))
+            else:
+                scored.append((offset, response))
+        return self._set_isolated_response(scored)
+
+
+    @staticmethod
+    def _get_isolation_max_requests(size):
+        # isolating one invalid input data costs 2 requests per halving, the limit allows
+        # about two of them instead of up to 2n-1 requests if all input data are invalid
+        return 4 * size.bit_length()
+
+
+    def _continue_isolation(self, pending, request_count, split_count, max_requests, error_message):
+        """False if the isolation stops, the pending rows are then rejected with the error_message
+        of the bundle. It stops if the halves and the quarters of the bundle are all rejected as a 
+        whole (the first 6 requests), which is typical for a mapping not matching the model schema,
+        or after max_requests requests.
+        """
+        if (request_count == 6 and split_count == 6) or request_count >= max_requests:
+            tracer.debug("Isolation of invalid input stopped after %d requests", request_count)
+            for offset, rows in pending:
+                self._reject_rows(offset, rows, error_message)
+            pending.clear()
+            return False
+        return True
+
+
+    @staticmethod
+    def _split_rows(offset, rows):
+        """Both halves of the rows with their offset."""
+        middle = len(rows) // 2
+        return [(offset, rows[:middle]), (offset + middle, rows[middle:])]
+
+
+    def _split_or_reject(self, offset, rows, err):
+        if self._get_error_status(err) == 400 and len(rows) > 1:
+            return self._split_rows(offset, rows)
+        self._reject_rows(offset, rows, str(err.args[0]))
+        return []
+
+
+    def _reject_rows(self, offset, rows, error_message):
+        # rows are the payload values of the successfully mapped input data only
+        mapped_indices = self._bundle_state.get_mapped_indices()
+        for index in mapped_indices[offset:offset + len(rows)]:
+            self._bundle_state.set_message(index, "WML API error: " + error_message)
+
+
+    @staticmethod
+    def _merge_predictions(predictions, response):
+        """Appends the prediction values of the response to the predictions, block by block."""
+        for block, prediction in enumerate(response['predictions']):
+            if block < len(predictions):
+                predictions[block]['values'].extend(prediction['values'])
+            else:
+                predictions.append({'fields': prediction['fields'], 'values': list(prediction['values'])})
+
+
+    def _set_isolated_response(self, scored):
+        """Merges the (offset, response) of the accepted parts in input order into one response."""
+        if not scored:
+            return False
+        predictions = []
+        for offset, response in sorted(scored, key = lambda part: part[0]):
+            self._merge_predictions(predictions, response)
+        self._rest_response = {'predictions': predictions}
+        return True
+        
+
+    def _post_payload(self, payload_list):
+        """Sends the payload directly to the scoring endpoint using the pooled 
+        connections of the scoring_session, without the WML client request processing.
+        """
+        endpoint = self.scoring_endpoint
+        headers = endpoint.headers
+        body, content_headers = self._encode_payload(payload_list)
+        for attempt in range(2):
+            response = self.scoring_session.post(endpoint.url,
+                                                 params = endpoint.params,
+                                                 headers = dict(headers, **content_headers),
+                                                 data = body,
+                                                 verify = endpoint.verify,
+                                                 timeout = self.request_timeout)
+            # token may have expired, get new headers once
+            if response.status_code == 401 and attempt == 0:
+                headers = endpoint.refresh_headers(headers)
+                continue
+            if response.status_code != 200:
+                raise WmlScoringError("Scoring request failed with status " + str(response.status_code) + ": " + response.text, response.status_code)
+            return self.serializer.loads(response.content)
+
+
+    def _encode_payload(self, payload_list):
+        """Returns the request body and its content headers for requests sent directly 
+        to the scoring endpoint. Bodies from compression_threshold size on are gzip compressed,
+        with fastest compression level as the request latency counts.
+        Compressed responses are accepted and decompressed by the HTTP client.
+        """
+        body = self.serializer.dumps({'input_data': payload_list})
+        if self.compression_threshold is not None and len(body) >= self.compression_threshold:
+            return gzip.compress(body, compresslevel = 1), _GZIP_HEADERS_
+        return body, _JSON_HEADERS_
+
+
+    def _set_rest_status(self, rest_success, error_message):
+        """Stores the result of the scoring request in the bundle state.
+        Used by all handler variants after the request is done.
+        """
         if rest_success:
-            for item in self._status_list:
-                if item["mapping_success"]:
-                    item["score_success"] = True
+            self._bundle_state.set_score_result(True)
         else:
             self._rest_response = None
-            for item in self._status_list:
-                item["score_success"] = False
-                if item["message"] is None:
-                    item["message"] = "WML API error: " + error_message
+            self._bundle_state.set_score_result(False, "WML API error: " + error_message)
 
         #tracer.debug("WMLOnlineScoring: Worker %d got %d predictions from WML model deployment!", self._handler_index, len(self._rest_response['predictions'][0]['values']))
     
+        if not self._rest_response:
+            return 0
         return len(self._rest_response['predictions']) # number of prediction response bundles
         
 
@@ -226,8 +525,10 @@ class WmlBundleRestHandler(BundleRestHandler):
         #scoring REST call had error, no result to process
         #just the error fields have to be provided
         if self._rest_response is None:
-            for index, item in enumerate(self._status_list):
-                self._result_list[index] = {"PredictionError": item["message"]}
+            get_message = self._bundle_state.get_message
+            for index in range(self._data_size):
+                self._result_list[index] = {"PredictionError": get_message(index)}
+            self._set_cached_results()
             return 
             
         #take the tuples from local list in sequence, sequence is same as the 
@@ -238,13 +539,71 @@ class WmlBundleRestHandler(BundleRestHandler):
         #each prediction contains model result 'fields' and one or more 'values' lists
         #one value list for each scoring set
         # only data with successful mapping was added in payload and gets response data
+        # one pass over the status gives the scored data and sets the error results
+        result_list = self._result_list
+        get_message = self._bundle_state.get_message
+        cached = self._bundle_state.cached
+        scored_indices = []
+        for data_index,scored in enumerate(self._bundle_state.score_success):
+            if not scored :
+                result_list[data_index] = {"PredictionError": get_message(data_index)}
+            elif not cached[data_index]:
+                scored_indices.append(data_index)
+
+        # a model with several outputs responds with several prediction blocks, 
+        # each block has a value list for each scored data, all blocks of a 
+        # data are merged into its one Prediction
+        if self.prediction_format == "values":
+            predictions = self._merge_prediction_values()
+        else:
+            predictions = self._merge_prediction_dicts()
+        if predictions is not None:
+            for data_index, merged in zip(scored_indices, predictions):
+                result_list[data_index] = {"Prediction" : merged}
+            if self.scoring_cache is not None:
+                cache_keys = self._cache_keys
+                self.scoring_cache.store([(cache_keys[data_index], merged) for data_index, merged in zip(scored_indices, predictions) 
+                                          if data_index in cache_keys])
+        self._set_cached_results()
+
+
+    def _set_cached_results(self):
+        # cached predictions are shared by the results, they are not changed
+        for data_index, prediction in self._cache_hits.items():
+            self._result_list[data_index] = {"Prediction" : prediction}
+
+
+    def _merge_prediction_dicts(self):
+        predictions = None
         for prediction in self._rest_response['predictions']:
-            response_index = 0 
-            for data_index,item in enumerate(self._status_list):
-                if item["mapping_success"] :
-                    self._result_list[data_index] = {"Prediction" : dict(zip(prediction['fields'],prediction['values'][response_index]))}
-                    response_index += 1 
-                else:
-                    self._result_list[data_index] = {"PredictionError": item["message"]}
+            fields = tuple(prediction['fields'])
+            if predictions is None:
+                predictions = [dict(zip(fields, values)) for values in prediction['values']]
+            else:
+                for merged, values in zip(predictions, prediction['values']):
+                    merged.update(zip(fields, values))
+        return predictions
+
+
+    def _merge_prediction_values(self):
+        """The value lists of the response are the Predictions, with one prediction block
+        they are taken without copy, several blocks are concatenated."""
+        predictions = None
+        fields = ()
+        for prediction in self._rest_response['predictions']:
+            fields += tuple(prediction['fields'])
+            if predictions is None:
+                predictions = prediction['values']
+            else:
+                predictions = [merged + values for merged, values in zip(predictions, prediction['values'])]
+        if fields != self.prediction_fields:
+            self._publish_prediction_fields(fields)
+        return predictions
+
+
+    def _publish_prediction_fields(self, fields):
+        # class variable, the field names are the same for all handlers
+        type(self).prediction_fields = fields
+        logger.info("Prediction fields of deployment %s: %s", self.deployment_guid, ", ".join(fields))
                     
 
@@ -0,0 +1,87 @@
+# coding=utf-8
+# Licensed Materials - Property of IBM
+# Copyright IBM Corp. 2020
+
+'''
+
+class WmlScoringEndpoint holds everything needed to send a scoring request
+directly to the online scoring REST endpoint of a WML deployment
+
+- it is resolved once with the WML client, not for each request
+- the authorization headers may be refreshed if the endpoint rejects
+  the token (401), refresh is done by the WML client
+- query parameters and headers are taken from the WML client, it has no public
+  API for them, the private functions are only called by _get_client_setting()
+- certificate verification follows the WML client setting of environment
+  variable WML_CLIENT_VERIFY_REQUESTS (True, False or a CA bundle path)
+
+'''
+
+import logging
+import os
+import threading
+
+tracer = logging.getLogger(__name__)
+
+
+class WmlScoringError(Exception):
+    '''Raised by handlers sending requests directly to the scoring endpoint
+    if the response status is not 200.
+    args: description [0] and status_code [1]
+    '''
+    def __init__(self, description, status_code):
+        super().__init__(description, status_code)
+        self.status_code = status_code
+
+
+def _get_client_setting(wml_client, function_name):
+    '''Calls the private WML client function function_name without arguments, the one
+    deployments.score() uses for its query parameters or headers.
+    Raises a RuntimeError if the WML client doesn't provide it (anymore).
+    '''
+    function = getattr(wml_client, function_name, None)
+    if not callable(function):
+        raise RuntimeError("WML client " + str(getattr(wml_client, 'version', '')) + " doesn't provide " + function_name + 
+                           "(), engine 'async' and transport 'direct' can't be used, use engine 'sync' with transport 'client'")
+    try:
+        return function()
+    except TypeError as err:
+        raise RuntimeError("WML client function " + function_name + "() changed, engine 'async' and transport 'direct' " + 
+                           "can't be used, use engine 'sync' with transport 'client': " + str(err)) from err
+
+
+class WmlScoringEndpoint():
+
+    def __init__(self, wml_client, deployment_guid):
+        '''Resolves URL, query parameters and headers of the scoring endpoint the
+        same way the WML client does in deployments.score()
+        '''
+        self._wml_client = wml_client
+        self._lock = threading.Lock()
+        details = wml_client.deployments.get_details(deployment_guid)
+        self.url = wml_client.deployments.get_scoring_href(details)
+        # version parameter is mandatory, space is defined by deployment
+        self.params = _get_client_setting(wml_client, '_params')
+        self.params.pop('space_id', None)
+        self.headers = _get_client_setting(wml_client, '_get_headers')
+        self.verify = self._get_verify()
+        tracer.debug("Scoring endpoint resolved: %s", self.url)
+
+    @staticmethod
+    def _get_verify():
+        verify = os.environ.get('WML_CLIENT_VERIFY_REQUESTS')
+        if verify is None or verify == 'True':
+            return True
+        if verify == 'False':
+            return False
+        return verify
+
+    def refresh_headers(self, rejected_headers):
+        '''Gets new headers from WML client, e.g. with a new token.
+        Only done once for all handlers which got rejected with the same headers.
+        '''
+        with self._lock:
+            if self.headers is rejected_headers:
+                tracer.debug("Refresh scoring endpoint headers")
+                self.headers = _get_client_setting(self._wml_client, '_get_headers')
+        return self.headers
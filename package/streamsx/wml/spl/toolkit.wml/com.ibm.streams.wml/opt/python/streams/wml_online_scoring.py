@@ -41,23 +41,50 @@ def spl_namespace():
 # SPL operators submit() function.
 # It is storing the reference to the SPL operator
 # to reach the correct submit().
+# All results of a list are submitted with one submit()
+# call instead of one call per tuple.
+# With structured output the results are submitted as 
+# dicts matching the output schema, prediction fields
+# are set as attributes, not pickled.
 ######################################################
+_OUTPUT_PORTS_ = ('result_port', 'error_port')
+
 class output_class():
-    def __init__(self, output_object):
+    def __init__(self, output_object, structured_output = False, prediction_mapping = None):
         self._output_object = output_object
+        self._structured_output = structured_output
+        # (model_field, tuple_field) pairs, None sets all prediction fields by name
+        self._prediction_mapping = None
+        if prediction_mapping:
+            self._prediction_mapping = [(field['model_field'], field['tuple_field']) for field in prediction_mapping]
     def __call__(self, results):
         #with self._output_object._output_lock:
         tracer.debug("Start output_function")
+        submit = self._output_object.submit
+        dumps = pickle.dumps
         for index,result_list in enumerate(results):
             tracer.debug("Start result submission ")
-            if index == 0:
-                for list_element in result_list:
-                    self._output_object.submit('result_port',{'__spl_po':memoryview(pickle.dumps(list_element))})
-            elif index == 1:
-                for list_element in result_list:
-                    self._output_object.submit('error_port',{'__spl_po':memoryview(pickle.dumps(list_element))})
-            else:
+            if index >= len(_OUTPUT_PORTS_):
                 tracer.error("Internal error: More result lists generated than supported. ")
+            elif not result_list:
+                continue
+            elif self._structured_output:
+                submit(_OUTPUT_PORTS_[index], [self._to_structured(list_element) for list_element in result_list])
+            else:
+                # submit() takes a list of tuples 
+                submit(_OUTPUT_PORTS_[index], [{'__spl_po':memoryview(dumps(list_element))} for list_element in result_list])
+    def _to_structured(self, result):
+        # result is the input tuple's own dict, it can be changed, 
+        # keys without output attribute are ignored by submit()
+        prediction = result.pop('Prediction', None)
+        if prediction is not None:
+            if self._prediction_mapping is None:
+                result.update(prediction)
+            else:
+                for model_field, tuple_field in self._prediction_mapping:
+                    if model_field in prediction:
+                        result[tuple_field] = prediction[model_field]
+        return result
 
 
 
@@ -80,7 +107,34 @@ class WMLOnlineScoring(spl.PrimitiveOperator):
                        threads_per_node,
                        single_output,
                        node_count,
-                       bundle_size):
+                       bundle_size,
+                       max_bundle_wait_ms = 0,
+                       adaptive_bundle_size = False,
+                       min_bundle_size = 1,
+                       max_bundle_size = 0,
+                       target_latency_ms = 1000,
+                       engine = "sync",
+                       max_in_flight = 8,
+                       transport = "client",
+                       compression_threshold = -1,
+                       serializer = "auto",
+                       connect_timeout_ms = 10000,
+                       read_timeout_ms = 60000,
+                       isolate_invalid_input = False,
+                       retry_max_attempts = 1,
+                       retry_backoff_ms = 100,
+                       retry_backoff_cap_ms = 10000,
+                       retry_jitter = True,
+                       retry_status_codes = "429,500,502,503,504",
+                       preserve_order = True,
+                       structured_output = False,
+                       prediction_mapping = "[]",
+                       numeric_input = False,
+                       output_fields = "null",
+                       prediction_format = "dict",
+                       cache_size = 0,
+                       cache_ttl_ms = 0,
+                       cache_version_check_ms = 60000):
         """Instantiates a WMLOnlineScoring object at application runtime (Streams application runtime container).
         
         It creates a WML client connecting to WML service with provided credentials and
@@ -101,8 +155,36 @@ class WMLOnlineScoring(spl.PrimitiveOperator):
                         single_output = single_output,
                         node_count = node_count,
                         field_mapping = field_mapping,
-                        output_function = output_class(self),
+                        output_function = output_class(self, structured_output, json.loads(prediction_mapping)),
                         bundle_size = bundle_size,
+                        max_bundle_wait_ms = max_bundle_wait_ms,
+                        adaptive_bundle_size = adaptive_bundle_size,
+                        min_bundle_size = min_bundle_size,
+                        max_bundle_size = max_bundle_size if max_bundle_size > 0 else None,
+                        target_latency_ms = target_latency_ms,
+                        preserve_order = preserve_order,
+                        # input tuples are created for each process() call 
+                        owns_input_data = True,
+                        output_fields = json.loads(output_fields),
+                        # wml specific controler argumnets
+                        engine = engine,
+                        max_in_flight = max_in_flight,
+                        transport = transport,
+                        compression_threshold = compression_threshold if compression_threshold >= 0 else None,
+                        serializer = serializer,
+                        connect_timeout_ms = connect_timeout_ms,
+                        read_timeout_ms = read_timeout_ms,
+                        isolate_invalid_input = isolate_invalid_input,
+                        numeric_input = numeric_input,
+                        prediction_format = prediction_format,
+                        retry_max_attempts = retry_max_attempts,
+                        retry_backoff_ms = retry_backoff_ms,
+                        retry_backoff_cap_ms = retry_backoff_cap_ms,
+                        retry_jitter = retry_jitter,
+                        retry_status_codes = [int(code) for code in retry_status_codes.split(",") if code],
+                        cache_size = cache_size,
+                        cache_ttl_ms = cache_ttl_ms,
+                        cache_version_check_ms = cache_version_check_ms,
                         # wml specific controler argumnets
                         deployment_guid = deployment_guid, 
                         wml_credentials = wml_credentials, 
@@ -146,15 +228,18 @@ class WMLOnlineScoring(spl.PrimitiveOperator):
         # we have control over this SPL tuple and define it to have single attribute being a blob 
         # the blob is filled from topology side with a python dict as we want to work on a dict
         # as most comfortable also when having no defined attribute sequence anymore
+        # pickle.loads() reads directly from the memoryview without copying it to bytes first,
+        # this is safe as the loaded objects don't reference the tuple's buffer
+        # the dict of a structured tuple is created for this call and is used without copy
 
         input_tuple=None
         if self._is_python_object_stream is True:
-            input_tuple = pickle.loads(python_tuple['__spl_po'].tobytes())
+            input_tuple = pickle.loads(python_tuple['__spl_po'])
         elif self._is_python_object_stream is False:
             input_tuple = python_tuple
         # only entered at first tuple, next time only the above two are checked
         elif "__spl_po" in python_tuple:
-            input_tuple = pickle.loads(python_tuple['__spl_po'].tobytes())
+            input_tuple = pickle.loads(python_tuple['__spl_po'])
             self._is_python_object_stream = True
         else:
             input_tuple = python_tuple
@@ -0,0 +1,284 @@
+###################################################################################
+# Micro benchmarks for the bundleresthandler internals
+#
+# Not part of the unit tests, run from package directory with
+#
+#     python3 -u -m streamsx.wml.tests.benchmark [benchmark_name ...]
+#
+# Without benchmark_name all benchmarks are run.
+###################################################################################
+from streamsx.wml.bundleresthandler.bundlequeue import BundleQueue
+from streamsx.wml.bundleresthandler.bundleresthandler import BundleRestHandler
+from streamsx.wml.bundleresthandler.bundlecontroller import BundleController
+from streamsx.wml.bundleresthandler.wmlbundleresthandler import WmlBundleRestHandler
+from streamsx.wml.bundleresthandler.payloadserializer import OrjsonPayloadSerializer, UjsonPayloadSerializer, PayloadSerializer
+
+import array
+import gzip
+import json
+import numpy
+import random
+import sys
+import threading
+import time
+
+
+###################################################################################
+# Input queue: former list slicing versus BundleQueue
+#
+# The queue is kept on a constant depth, for each bundle taken a bundle of
+# new data is appended. Measures bundles/s the handlers could take out of
+# the queue depending on the queue depth.
+###################################################################################
+def _list_take_bundle(queue, bundle_size):
+    end_index = bundle_size if len(queue) >= bundle_size else len(queue)
+    bundle = queue[:end_index]
+    del queue[:end_index]
+    return bundle
+
+def _bundlequeue_take_bundle(queue, bundle_size):
+    return queue.pop_bundle(bundle_size)
+
+def _run_queue(queue, take_bundle, bundle_size, rounds):
+    data = {"a":1}
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for _ in range(bundle_size):
+            queue.append(data)
+        take_bundle(queue, bundle_size)
+    return rounds / (time.perf_counter() - start)
+
+def benchmark_queue(bundle_size = 100, rounds = 2000):
+    print("############# benchmark_queue() bundle_size=%d ###############" % bundle_size)
+    print("    %10s %16s %16s %8s" % ("depth", "list bundles/s", "queue bundles/s", "factor"))
+    for depth in [1000, 10000, 50000, 100000, 500000]:
+        list_queue = [{"a":i} for i in range(depth)]
+        bundle_queue = BundleQueue(list_queue)
+        list_rate = _run_queue(list_queue, _list_take_bundle, bundle_size, rounds)
+        queue_rate = _run_queue(bundle_queue, _bundlequeue_take_bundle, bundle_size, rounds)
+        print("    %10d %16.0f %16.0f %8.1f" % (depth, list_rate, queue_rate, queue_rate / list_rate))
+
+
+
+
+###################################################################################
+# Request compression: CPU time versus bytes saved
+#
+# Scoring payloads of typical bundle shapes (bundle size x number of features)
+# are JSON encoded and gzip compressed with different levels.
+###################################################################################
+def _payload(bundle_size, feature_count):
+    fields = ["feature_%d" % i for i in range(feature_count)]
+    values = [[round(random.uniform(0, 100), 3) for _ in range(feature_count)] for _ in range(bundle_size)]
+    return {'input_data': [{'fields': fields, 'values': values}]}
+
+def _time_per_call(function, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        function()
+    return (time.perf_counter() - start) / rounds
+
+def benchmark_compression(rounds = 20):
+    print("############# benchmark_compression() ###############")
+    print("    %8s %8s %10s %9s %6s %10s %9s %10s" % ("bundle", "features", "json bytes", "json ms", "level", "gzip bytes", "gzip ms", "saved"))
+    for bundle_size, feature_count in [(10, 4), (100, 4), (100, 50), (100, 500), (1000, 50), (1000, 500)]:
+        payload = _payload(bundle_size, feature_count)
+        body = json.dumps(payload).encode('utf-8')
+        json_ms = _time_per_call(lambda: json.dumps(payload), rounds) * 1000
+        for level in [1, 6]:
+            compressed = gzip.compress(body, compresslevel = level)
+            gzip_ms = _time_per_call(lambda: gzip.compress(body, compresslevel = level), rounds) * 1000
+            print("    %8d %8d %10d %9.3f %6d %10d %9.3f %9.0f%%" % (bundle_size, feature_count, len(body), json_ms, level, 
+                                                               len(compressed), gzip_ms, 100.0 * (1 - len(compressed) / len(body))))
+
+
+
+
+###################################################################################
+# Payload serializer: encoding request and decoding response per library
+#
+# The '__array__' mapping delivers one numpy row per input data, the
+# response contains one prediction with a probability list per input data.
+###################################################################################
+def benchmark_serializer(rounds = 20):
+    print("############# benchmark_serializer() ###############")
+    print("    %8s %8s %10s %10s %10s" % ("library", "bundle", "features", "dumps ms", "loads ms"))
+    for bundle_size, feature_count in [(100, 10), (100, 784), (1000, 50)]:
+        payload = {'input_data': [{'values': [numpy.random.rand(feature_count) for _ in range(bundle_size)]}]}
+        response = {'predictions': [{'fields': ['prediction', 'probability'], 
+                                     'values': [[1, [0.25, 0.75]] for _ in range(bundle_size)]}]}
+        for serializer_class in [PayloadSerializer, UjsonPayloadSerializer, OrjsonPayloadSerializer]:
+            if not serializer_class.is_available():
+                continue
+            serializer = serializer_class()
+            body = serializer.dumps(response)
+            dumps_ms = _time_per_call(lambda: serializer.dumps(payload), rounds) * 1000
+            loads_ms = _time_per_call(lambda: serializer.loads(body), rounds) * 1000
+            print("    %8s %8d %10d %10.3f %10.3f" % (serializer.name, bundle_size, feature_count, dumps_ms, loads_ms))
+
+
+
+
+###################################################################################
+# Ordered versus unordered output with skewed scoring latency
+#
+# The scoring request is simulated with 5 ms latency, every 20th request
+# takes 200 ms. Measures throughput and latency of each input data from
+# process_data() until it is written to output, with input as fast as
+# possible (full queue) and with input rate limited to about half of the
+# throughput.
+###################################################################################
+class _SkewedLatencyHandler(BundleRestHandler):
+    def preprocess(self):
+        pass
+    def synch_rest_call(self):
+        time.sleep(0.2 if random.random() < 0.05 else 0.005)
+    def postprocess(self):
+        for index in range(self._data_size):
+            self._result_list[index] = {}
+
+class _LatencyRecorder():
+    def __init__(self, count):
+        self.latencies = []
+        self._count = count
+        self.done = threading.Event()
+    def __call__(self, result_lists):
+        now = time.perf_counter()
+        self.latencies.extend(now - data["start"] for data in result_lists[0])
+        if len(self.latencies) >= self._count:
+            self.done.set()
+
+def benchmark_order(count = 20000, threads = 8, bundle_size = 10):
+    print("############# benchmark_order() threads=%d bundle_size=%d ###############" % (threads, bundle_size))
+    print("    %10s %14s %12s %10s %10s %10s" % ("input/s", "preserve_order", "tuples/s", "p50 ms", "p99 ms", "max ms"))
+    for rate, preserve_order in [(None, True), (None, False), (2500, True), (2500, False)]:
+        random.seed(0)
+        recorder = _LatencyRecorder(count)
+        controller = BundleController(queue_size = 1000, 
+                                      threads_per_node = threads,
+                                      single_output = True,
+                                      node_count = 1,
+                                      field_mapping = json.dumps([]),
+                                      output_function = recorder,
+                                      handler_class = _SkewedLatencyHandler,
+                                      bundle_size = bundle_size,
+                                      preserve_order = preserve_order)
+        controller.prepare()
+        controller.run()
+        start = time.perf_counter()
+        for index in range(count):
+            if rate is not None and index % 10 == 0:
+                delay = start + index / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            controller.process_data({"start": time.perf_counter()})
+        recorder.done.wait()
+        duration = time.perf_counter() - start
+        controller.stop()
+        controller.finish()
+        latencies = sorted(recorder.latencies)
+        print("    %10s %14s %12.0f %10.1f %10.1f %10.1f" % (rate or "max", preserve_order, count / duration, 
+                                                       latencies[len(latencies) // 2] * 1000,
+                                                       latencies[int(len(latencies) * 0.99)] * 1000,
+                                                       latencies[-1] * 1000))
+
+
+
+
+###################################################################################
+# Mapping of input data to the scoring payload in WmlBundleRestHandler.preprocess()
+#
+# Measures input data/s mapped for bundles of 100 input data with numeric fields
+# and with the '__array__' mapping of numpy rows, without and with encoding of
+# the request body by the default payload serializer.
+###################################################################################
+def _run_preprocess(field_mapping, data, rounds, numeric_input = False):
+    WmlBundleRestHandler.field_mapping = field_mapping
+    WmlBundleRestHandler.numeric_input = numeric_input
+    WmlBundleRestHandler.input_list_lock = threading.Condition()
+    WmlBundleRestHandler.input_list_space = None
+    WmlBundleRestHandler.source_data_list = BundleQueue()
+    WmlBundleRestHandler.output_function = print
+    handler = WmlBundleRestHandler(0)
+    handler._data_list = data
+    handler._data_size = len(data)
+    rates = []
+    for encode in [False, True]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            handler.get_bundle_state().reset(handler._data_size)
+            handler.preprocess()
+            if encode:
+                handler._encode_payload(handler.get_payload())
+        rates.append(rounds * len(data) / (time.perf_counter() - start))
+    return tuple(rates)
+
+def benchmark_preprocess(bundle_size = 100, rounds = 500):
+    print("############# benchmark_preprocess() bundle_size=%d ###############" % bundle_size)
+    print("    %10s %10s %16s %16s" % ("mapping", "features", "input data/s", "with encoding"))
+    for feature_count in [4, 20, 100]:
+        field_mapping = [{"model_field":"f%d_" % i, "tuple_field":"f%d" % i} for i in range(feature_count)]
+        data = [{"f%d" % i: random.random() for i in range(feature_count)} for _ in range(bundle_size)]
+        print("    %10s %10d %16.0f %16.0f" % (("fields", feature_count) + _run_preprocess(field_mapping, data, rounds)))
+        print("    %10s %10d %16.0f %16.0f" % (("numeric", feature_count) + _run_preprocess(field_mapping, data, rounds, numeric_input = True)))
+    for feature_count in [4, 20, 100, 784]:
+        field_mapping = [{"model_field":"__array__", "tuple_field":"f"}]
+        data = [{"f": numpy.random.rand(feature_count)} for _ in range(bundle_size)]
+        print("    %10s %10d %16.0f %16.0f" % (("__array__", feature_count) + _run_preprocess(field_mapping, data, rounds)))
+        data = [{"f": array.array('d', row["f"])} for row in data]
+        print("    %10s %10d %16.0f %16.0f" % (("array.array", feature_count) + _run_preprocess(field_mapping, data, rounds)))
+
+
+
+###################################################################################
+# Assembly of the results in WmlBundleRestHandler.postprocess()
+#
+# Measures input data/s for bundles of 100 input data, 10% with mapping error,
+# and a response with one or several prediction blocks (multi-output models),
+# with predictions as dicts and as value lists.
+###################################################################################
+def benchmark_postprocess(bundle_size = 100, rounds = 2000):
+    print("############# benchmark_postprocess() bundle_size=%d ###############" % bundle_size)
+    print("    %10s %10s %16s" % ("format", "blocks", "input data/s"))
+    WmlBundleRestHandler.field_mapping = [{"model_field":"a_", "tuple_field":"a"}]
+    WmlBundleRestHandler.input_list_lock = threading.Condition()
+    WmlBundleRestHandler.input_list_space = None
+    WmlBundleRestHandler.source_data_list = BundleQueue()
+    WmlBundleRestHandler.output_function = print
+    handler = WmlBundleRestHandler(0)
+    handler._data_size = bundle_size
+    handler._result_list = [None] * bundle_size
+    state = handler.get_bundle_state()
+    state.reset(bundle_size)
+    for index in range(bundle_size):
+        if index % 10 == 0:
+            state.set_mapping_error(index, "Mapping error: input field: a")
+        else:
+            state.set_mapped(index)
+    state.set_score_result(True)
+    scored = len(state.get_mapped_indices())
+    for prediction_format in ["dict", "values"]:
+        WmlBundleRestHandler.prediction_format = prediction_format
+        for blocks in [1, 2, 4]:
+            handler._rest_response = {'predictions': [{'fields': ['prediction%d' % block, 'probability%d' % block], 
+                                                       'values': [[index, 0.5] for index in range(scored)]} for block in range(blocks)]}
+            start = time.perf_counter()
+            for _ in range(rounds):
+                handler.postprocess()
+            print("    %10s %10d %16.0f" % (prediction_format, blocks, rounds * bundle_size / (time.perf_counter() - start)))
+    WmlBundleRestHandler.prediction_format = "dict"
+
+
+
+_BENCHMARKS = {"queue" : benchmark_queue,
+               "compression" : benchmark_compression,
+               "serializer" : benchmark_serializer,
+               "order" : benchmark_order,
+               "preprocess" : benchmark_preprocess,
+               "postprocess" : benchmark_postprocess,
+              }
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(_BENCHMARKS)
+    for name in names:
+        _BENCHMARKS[name]()
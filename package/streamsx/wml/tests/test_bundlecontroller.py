@@ -14,8 +14,15 @@ from streamsx.wml.bundleresthandler.wmlbundleresthandler import WmlBundleRestHan
 from streamsx.wml.bundleresthandler.bundleresthandler import BundleRestHandler
 from streamsx.wml.bundleresthandler.bundlecontroller import BundleController
 from streamsx.wml.bundleresthandler.wmlbundlecontroller import WmlBundleController
+from streamsx.wml.bundleresthandler.bundlesizer import AdaptiveBundleSize
+from streamsx.wml.bundleresthandler.reorderbuffer import ReorderBuffer
+from streamsx.wml.bundleresthandler.bundlequeue import BundleQueue
+from streamsx.wml.bundleresthandler.payloadserializer import get_serializer
 
 import threading
+import random
+import sys
+import tracemalloc
 
 
 
@@ -47,6 +54,21 @@ class output_class():
         print ("#####################################################")
 
 
+###################################################################################
+# Handler class used in bundlecontroller tests with data
+# it doesn't do any REST call, each input data gets an empty result
+###################################################################################
+class LoopbackRestHandler(BundleRestHandler):
+    def preprocess(self):
+        pass
+    def synch_rest_call(self):
+        # varying latency, so bundles complete out of order
+        time.sleep(random.uniform(0, 0.002))
+    def postprocess(self):
+        for index in range(self._data_size):
+            self._result_list[index] = {}
+
+
 ###################################################################################
 # Class with callable as test source
 ###################################################################################
@@ -151,10 +173,480 @@ class Test(unittest.TestCase):
         client.stop()
         time.sleep(2)
         client.finish()
+
+
+        print("    check empty field mapping is accepted")
+        client = BundleController (
+                       queue_size = 100, 
+                       threads_per_node = 1,
+                       single_output = False,
+                       node_count = 1,
+                       field_mapping = json.dumps([]),
+                       output_function = (lambda x: print(x)),
+                       handler_class = BundleRestHandler)
+        assert [] == BundleRestHandler.field_mapping_plan.model_fields
         
         print ("    Test OK")
 
 
+    ##################################################################
+    # Test the data flow from controller to the handler threads
+    # - a single tuple is processed without waiting for a full bundle
+    # - all data is delivered to output in order
+    # - stop wakes up the waiting threads without timeout polling
+    ##################################################################        
+    def test_bundleController_process_data(self):
+        print("############# test_bundleController_process_data() ###############")
+        field_mapping =json.dumps([{"model_field":"a_", "tuple_field":"a"}])
+
+        # a callable object is needed as output_function, a function would
+        # be bound to the handler instance as it is set as class variable
+        results = []
+        output_done = threading.Condition()
+        class output_function():
+            def __call__(self, result_lists):
+                with output_done:
+                    results.extend(result_lists[0])
+                    output_done.notify_all()
+
+        client = BundleController (
+                       queue_size = 100, 
+                       threads_per_node = 3,
+                       single_output = True,
+                       node_count = 1,
+                       field_mapping = field_mapping,
+                       output_function = output_function(),
+                       handler_class = LoopbackRestHandler,
+                       bundle_size = 10)
+        client.prepare()
+        client.run()
+        self.addCleanup(client.stop)
+
+        print("    check single tuple is processed immediately")
+        start = time.time()
+        client.process_data({"a":0})
+        with output_done:
+            assert output_done.wait_for(lambda : len(results) == 1, 5.0)
+        assert time.time() - start < 1.0
+
+        print("    check all tuples are processed")
+        for i in range(1,1000):
+            client.process_data({"a":i})
+        with output_done:
+            assert output_done.wait_for(lambda : len(results) == 1000, 10.0)
+        assert list(range(1000)) == [result["a"] for result in results]
+
+        print("    check stop ends waiting threads")
+        start = time.time()
+        client.stop()
+        client.finish()
+        assert time.time() - start < 1.0
+
+        print ("    Test OK")
+
+
+    ##################################################################
+    # Test unordered output, preserve_order = False
+    # - results are written without reorder buffer
+    # - all results are written
+    ##################################################################        
+    def test_bundleController_unordered(self):
+        print("############# test_bundleController_unordered() ###############")
+        field_mapping =json.dumps([{"model_field":"a_", "tuple_field":"a"}])
+
+        results = []
+        output_done = threading.Condition()
+        class output_function():
+            def __call__(self, result_lists):
+                with output_done:
+                    results.extend(result_lists[0])
+                    output_done.notify_all()
+
+        client = BundleController (
+                       queue_size = 100, 
+                       threads_per_node = 3,
+                       single_output = True,
+                       node_count = 1,
+                       field_mapping = field_mapping,
+                       output_function = output_function(),
+                       handler_class = LoopbackRestHandler,
+                       bundle_size = 10,
+                       preserve_order = False)
+        self.addCleanup(setattr, LoopbackRestHandler, "reorder_buffer", None)
+        assert LoopbackRestHandler.reorder_buffer is None
+        assert LoopbackRestHandler.keep_data_order is False
+        client.prepare()
+        client.run()
+        self.addCleanup(client.stop)
+
+        for i in range(1000):
+            client.process_data({"a":i})
+        with output_done:
+            assert output_done.wait_for(lambda : len(results) == 1000, 10.0)
+        assert list(range(1000)) == sorted(result["a"] for result in results)
+
+        client.stop()
+        client.finish()
+
+        print ("    Test OK")
+
+
+    ##################################################################
+    # Test back-pressure of a stalled bundle with preserve_order
+    # - the other handlers complete only the bundles within the 
+    #   reorder window, then input blocks on the full queue
+    # - after the stalled bundle completes all results are written
+    #   in order
+    ##################################################################        
+    def test_bundleController_stalled_bundle(self):
+        print("############# test_bundleController_stalled_bundle() ###############")
+        field_mapping =json.dumps([{"model_field":"a_", "tuple_field":"a"}])
+
+        results = []
+        output_done = threading.Condition()
+        class output_function():
+            def __call__(self, result_lists):
+                with output_done:
+                    results.extend(result_lists[0])
+                    output_done.notify_all()
+
+        release = threading.Event()
+        class StalledRestHandler(LoopbackRestHandler):
+            def synch_rest_call(self):
+                if self._bundle_number == 0:
+                    release.wait()
+
+        threads = 4
+        queue_size = 100
+        bundle_size = 10
+        client = BundleController (
+                       queue_size = queue_size, 
+                       threads_per_node = threads,
+                       single_output = True,
+                       node_count = 1,
+                       field_mapping = field_mapping,
+                       output_function = output_function(),
+                       handler_class = StalledRestHandler,
+                       bundle_size = bundle_size)
+        client.prepare()
+        client.run()
+        self.addCleanup(client.stop)
+        self.addCleanup(release.set)
+
+        accepted = [0]
+        def feed():
+            for i in range(1000):
+                client.process_data({"a":i})
+                accepted[0] += 1
+        feeder = threading.Thread(target = feed, daemon = True)
+        feeder.start()
+
+        print("    check input blocks once queue and window are full")
+        count = -1
+        while count != accepted[0]:
+            count = accepted[0]
+            feeder.join(0.2)
+        assert feeder.is_alive()
+        window = client._reorder_buffer.window
+        # queue, bundles pending in the window and bundles held by the handlers
+        assert count <= queue_size + (window + threads) * bundle_size
+        assert [] == results
+
+        print("    check all results are written in order after the stall")
+        release.set()
+        feeder.join(10.0)
+        assert not feeder.is_alive()
+        with output_done:
+            assert output_done.wait_for(lambda : len(results) == 1000, 10.0)
+        assert list(range(1000)) == [result["a"] for result in results]
+
+        client.stop()
+        client.finish()
+
+        print ("    Test OK")
+
+
+    ##################################################################
+    # Test bundling with max_bundle_wait_ms
+    # - a partial bundle is sent after the wait time as one bundle
+    # - a full bundle is sent without waiting
+    ##################################################################        
+    def test_bundleController_max_bundle_wait(self):
+        print("############# test_bundleController_max_bundle_wait() ###############")
+        field_mapping =json.dumps([{"model_field":"a_", "tuple_field":"a"}])
+
+        bundles = []
+        output_done = threading.Condition()
+        class output_function():
+            def __call__(self, result_lists):
+                with output_done:
+                    bundles.append(result_lists[0])
+                    output_done.notify_all()
+
+        client = BundleController (
+                       queue_size = 100, 
+                       threads_per_node = 2,
+                       single_output = True,
+                       node_count = 1,
+                       field_mapping = field_mapping,
+                       output_function = output_function(),
+                       handler_class = LoopbackRestHandler,
+                       bundle_size = 10,
+                       max_bundle_wait_ms = 500)
+        client.prepare()
+        client.run()
+        self.addCleanup(client.stop)
+
+        print("    check partial bundle is sent after wait time")
+        start = time.time()
+        for i in range(3):
+            client.process_data({"a":i})
+        with output_done:
+            assert output_done.wait_for(lambda : len(bundles) == 1, 5.0)
+        assert time.time() - start >= 0.45
+        assert [{"a":i} for i in range(3)] == bundles[0]
+
+        print("    check full bundle is sent immediately")
+        start = time.time()
+        for i in range(10):
+            client.process_data({"a":i})
+        with output_done:
+            assert output_done.wait_for(lambda : len(bundles) == 2, 5.0)
+        assert time.time() - start < 0.4
+        assert 10 == len(bundles[1])
+
+        client.stop()
+        client.finish()
+        print ("    Test OK")
+
+
+    ##################################################################
+    # Test the adaptive bundle size
+    # - increased while full bundles are below target latency
+    # - decreased on p99 latency above target
+    # - kept within min/max limits
+    ##################################################################        
+    def test_AdaptiveBundleSize(self):
+        print("############# test_AdaptiveBundleSize() ###############")
+        sizer = AdaptiveBundleSize(initial_size = 100, min_size = 10, max_size = 200, 
+                                   target_latency = 0.5, window = 10, increase_step = 20)
+
+        print("    check no change within window")
+        for _ in range(9):
+            sizer.record(0.1, 100)
+        assert sizer.size == 100
+        print("    check increase with full bundles below target")
+        sizer.record(0.1, 100)
+        assert sizer.size == 120
+        print("    check no increase with partial bundles")
+        for _ in range(10):
+            sizer.record(0.1, 5)
+        assert sizer.size == 120
+        print("    check max limit")
+        for _ in range(100):
+            sizer.record(0.1, sizer.size)
+        assert sizer.size == 200
+        print("    check decrease on p99 above target")
+        for _ in range(9):
+            sizer.record(0.1, 200)
+        sizer.record(0.9, 200)
+        assert sizer.size == 100
+        print("    check min limit")
+        for _ in range(100):
+            sizer.record(0.9, sizer.size)
+        assert sizer.size == 10
+        print ("    Test OK")
+
+
+    ##################################################################
+    # Test the ReorderBuffer writing the results of the bundles
+    # - bundles completed out of order are written in input order
+    # - output is written by one thread at a time
+    ##################################################################        
+    def test_ReorderBuffer(self):
+        print("############# test_ReorderBuffer() ###############")
+
+        # a callable object is needed as output_function, checks that
+        # output is written by one thread at a time
+        class output_function():
+            def __init__(self):
+                self.results = []
+                self.concurrent = False
+                self._active = threading.Lock()
+            def __call__(self, result_lists):
+                if not self._active.acquire(blocking = False):
+                    self.concurrent = True
+                    return
+                time.sleep(0.0005)
+                self.results.append(result_lists)
+                self._active.release()
+
+        print("    check bundles completed out of order are written in order")
+        output = output_function()
+        reorder_buffer = ReorderBuffer(output)
+        assert [0, 1, 2] == [reorder_buffer.reserve() for _ in range(3)]
+        reorder_buffer.put(2, "bundle2")
+        reorder_buffer.put(1, "bundle1")
+        assert [] == output.results
+        assert 2 == reorder_buffer.get_pending_count()
+        reorder_buffer.put(0, "bundle0")
+        assert ["bundle0", "bundle1", "bundle2"] == output.results
+        assert 0 == reorder_buffer.get_pending_count()
+
+        print("    check bundles put from several threads")
+        output = output_function()
+        reorder_buffer = ReorderBuffer(output)
+        sequences = [reorder_buffer.reserve() for _ in range(400)]
+        def put_bundles(thread_sequences):
+            for sequence in thread_sequences:
+                time.sleep(random.uniform(0, 0.001))
+                reorder_buffer.put(sequence, sequence)
+        threads = [threading.Thread(target = put_bundles, args = (sequences[index::4],)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sequences == output.results
+        assert not output.concurrent
+
+        print("    check put waits for bundles outside the window")
+        output = output_function()
+        reorder_buffer = ReorderBuffer(output, window = 2)
+        sequences = [reorder_buffer.reserve() for _ in range(3)]
+        assert reorder_buffer.is_in_window(1)
+        assert not reorder_buffer.is_in_window(2)
+        thread = threading.Thread(target = reorder_buffer.put, args = (2, "bundle2"))
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()
+        reorder_buffer.put(1, "bundle1")
+        assert thread.is_alive()
+        reorder_buffer.put(0, "bundle0")
+        thread.join(5.0)
+        assert not thread.is_alive()
+        assert ["bundle0", "bundle1", "bundle2"] == output.results
+
+        print ("    Test OK")
+
+
+    #########################################################################
+    # Test that a handler reuses its bundle buffers
+    # - after the first bundles copy_from_source() doesn't keep 
+    #   any new allocations
+    # - a bundle doesn't allocate temporary lists of the bundle size,
+    #   new data, status and result lists would need several times 
+    #   this size
+    # - smaller and larger bundles reuse the same lists
+    #########################################################################
+    def test_bundleRestHandler_buffer_reuse(self):
+        print("############# test_bundleRestHandler_buffer_reuse() ###############")
+        bundle_size = 1000
+
+        class buffer_handler(LoopbackRestHandler):
+            pass
+        buffer_handler.input_list_lock = threading.Condition()
+        buffer_handler.source_data_list = BundleQueue([{"a":i} for i in range(bundle_size)] * 60)
+        buffer_handler.max_copy_size = bundle_size
+        buffer_handler.field_mapping = []
+        buffer_handler.output_function = output_class(self)
+        buffer_handler.bundle_sizer = None
+        buffer_handler.reorder_buffer = None
+        buffer_handler.input_list_space = None
+        buffer_handler.max_bundle_wait = 0
+        handler = buffer_handler(0)
+
+        for _ in range(5):
+            assert bundle_size == handler.copy_from_source()
+        data_list = handler._data_list
+        tracemalloc.start()
+        try:
+            start, _ = tracemalloc.get_traced_memory()
+            for _ in range(50):
+                assert bundle_size == handler.copy_from_source()
+            current, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        print("    allocated: " + str(current - start) + " peak: " + str(peak - start))
+        assert data_list is handler._data_list
+        assert current - start < 1024
+        assert peak - start < 0.5 * sys.getsizeof([None] * bundle_size)
+        assert [{"a":i} for i in range(bundle_size)] == handler._data_list
+        assert [None] * bundle_size == handler._result_list
+
+        result_list = handler._result_list
+        # the source list continues with the rest of the bundle_size source data
+        for first, size in [(0, 300), (300, 700)]:
+            buffer_handler.max_copy_size = size
+            assert size == handler.copy_from_source()
+            assert data_list is handler._data_list
+            assert result_list is handler._result_list
+            assert [{"a":i} for i in range(first, first + size)] == handler._data_list
+            assert [None] * size == handler._result_list
+
+
+    ##################################################################
+    # Test the handler class variables set by the WML controller
+    # - transport "direct" sets the scoring endpoint and session
+    # - a later controller with transport "client" resets them
+    ##################################################################        
+    def test_WmlBundleController_transport(self):
+        print("############# test_WmlBundleController_transport() ###############")
+
+        class deployments_stub():
+            def get_details(self, deployment_guid):
+                return {"deployment_guid": deployment_guid}
+            def get_scoring_href(self, details):
+                return "https://wml/" + details["deployment_guid"] + "/predictions"
+
+        class wml_client_stub():
+            def __init__(self):
+                self.deployments = deployments_stub()
+            def _params(self):
+                return {"version": "2020-09-01"}
+            def _get_headers(self):
+                return {"Authorization": "Bearer token"}
+
+        # no WML service is needed to configure the handler class
+        class stub_controller(WmlBundleController):
+            def _create_wml_client(self):
+                return wml_client_stub()
+
+        for name in ("wml_client", "scoring_endpoint", "scoring_session", "compression_threshold", "request_timeout", "reorder_buffer"):
+            self.addCleanup(setattr, WmlBundleRestHandler, name, None)
+        self.addCleanup(setattr, WmlBundleRestHandler, "serializer", WmlBundleRestHandler.serializer)
+
+        def create_controller(transport):
+            return stub_controller(deployment_guid = "xyz", 
+                                   wml_credentials = json.dumps({}), 
+                                   space_guid = "xyz",
+                                   transport = transport,
+                                   compression_threshold = 1000,
+                                   serializer = "json",
+                                   queue_size = 100, 
+                                   threads_per_node = 2,
+                                   node_count = 1,
+                                   field_mapping = json.dumps([{"model_field":"a_", "tuple_field":"a"}]),
+                                   output_function = (lambda x: print(x)),
+                                   handler_class = WmlBundleRestHandler)
+
+        print("    check transport direct sets endpoint and session")
+        create_controller("direct")
+        assert "https://wml/xyz/predictions" == WmlBundleRestHandler.scoring_endpoint.url
+        assert WmlBundleRestHandler.scoring_session is not None
+        assert 1000 == WmlBundleRestHandler.compression_threshold
+        assert (10.0, 60.0) == WmlBundleRestHandler.request_timeout
+
+        print("    check transport client resets them")
+        create_controller("client")
+        assert WmlBundleRestHandler.scoring_endpoint is None
+        assert WmlBundleRestHandler.scoring_session is None
+        assert WmlBundleRestHandler.compression_threshold is None
+        assert WmlBundleRestHandler.request_timeout is None
+        assert type(WmlBundleRestHandler.serializer) is type(get_serializer())
+
+        print ("    Test OK")
+
+
     ##################################################################
     # Test the interface for creating, starting, stopping, finishing
     # wmlbundleresthandler threads
@@ -165,6 +657,8 @@ class Test(unittest.TestCase):
     ##################################################################        
     def test_WmlBundleController_simplethreads(self):
         print("############# test_WmlBundleController_simplethreads() ###############")
+        # the controller configures the handler class even if it fails later
+        self.addCleanup(setattr, WmlBundleRestHandler, "reorder_buffer", None)
 
         field_mapping =json.dumps([{"model_field":"Sepal.Length",
                             "is_mandatory":True,
@@ -12,11 +12,27 @@ import streamsx.wml as wml
 import streamsx.wml.utils as wml_utils
 from streamsx.wml.bundleresthandler.wmlbundleresthandler import WmlBundleRestHandler
 from streamsx.wml.bundleresthandler.bundleresthandler import BundleRestHandler
+from streamsx.wml.bundleresthandler.bundlequeue import BundleQueue
+from streamsx.wml.bundleresthandler.wmlasyncbundleresthandler import WmlAsyncBundleRestHandler
+import streamsx.wml.bundleresthandler.wmlasyncbundleresthandler as wmlasyncbundleresthandler
+from streamsx.wml.bundleresthandler.reorderbuffer import ReorderBuffer
+from streamsx.wml.bundleresthandler.retrypolicy import RetryPolicy
+from streamsx.wml.bundleresthandler.fieldmappingplan import FieldMappingPlan
+from streamsx.wml.bundleresthandler.bundlestate import BundleState
+from streamsx.wml.bundleresthandler.scoringcache import ScoringCache
+from streamsx.wml.bundleresthandler.wmlscoringendpoint import WmlScoringEndpoint
+from streamsx.wml.bundleresthandler.payloadserializer import get_serializer, PayloadSerializer, OrjsonPayloadSerializer, UjsonPayloadSerializer
 
 import threading
+import array
+import asyncio
+import gzip
+import tracemalloc
 import numpy
+import requests
 
 from ibm_watson_machine_learning import APIClient
+from ibm_watson_machine_learning.wml_client_error import WMLClientError
 
 
 
@@ -181,6 +197,80 @@ class Test(unittest.TestCase):
             self._build_only(name, topo)
             
             
+    #########################################################################
+    # Test the structured output streams of the operator
+    # - output_schema is used for both output streams
+    # - prediction_mapping needs output_schema
+    # only the topology is created, nothing is built
+    #########################################################################
+    def test_score_bundle_output_schema(self):
+        print ('\n---------'+str(self))
+
+        field_mapping =[{'model_field':'Sepal.Length', 'tuple_field':'sepal_length'},
+                        {'model_field':'Sepal.Width', 'tuple_field':'sepal_width'}]
+        credentials = {"apikey" : "xxx", "url" : "xxx"}
+        output_schema = StreamSchema('tuple<float64 sepal_length, float64 sepal_width, int64 prediction, list<float64> probability, rstring PredictionError>')
+
+        topo = Topology('test_score_bundle_output_schema')
+        source_stream = topo.source(TestSource())
+        scorings,invalids = wml.wml_online_scoring(source_stream,
+                                     "deployment_guid",
+                                     field_mapping, 
+                                     credentials,
+                                     "space_guid",
+                                     output_schema = output_schema,
+                                     prediction_mapping = [{'model_field':'probability', 'tuple_field':'probability'},
+                                                           {'model_field':'prediction', 'tuple_field':'prediction'}])
+        assert output_schema == scorings.oport.schema
+        assert output_schema == invalids.oport.schema
+
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid")
+        assert CommonSchema.Python == scorings.oport.schema
+
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                                   output_schema = 'tuple<float64 sepal_length, int64 prediction>')
+        assert StreamSchema('tuple<float64 sepal_length, int64 prediction>') == scorings.oport.schema
+
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   prediction_mapping = [{'model_field':'prediction', 'tuple_field':'prediction'}])
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   output_schema = 42)
+
+        # projection of the input attributes
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                                   output_fields = ['sepal_length'])
+        assert CommonSchema.Python == scorings.oport.schema
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   output_fields = 'sepal_length')
+
+        # prediction values without field names
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                                   prediction_format = 'values')
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   prediction_format = 'values', output_schema = output_schema)
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   prediction_format = 'array')
+
+        # retried status codes
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid")
+        assert "429,500,502,503,504" == scorings.oport.operator.params['retry_status_codes']
+        scorings,invalids = wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                                   retry_status_codes = [503])
+        assert "503" == scorings.oport.operator.params['retry_status_codes']
+
+        # timeouts of requests sent directly
+        wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                               transport = 'direct', connect_timeout_ms = 0, read_timeout_ms = 5000)
+        with self.assertRaises(Exception):
+            wml.wml_online_scoring(source_stream, "deployment_guid", field_mapping, credentials, "space_guid",
+                                   read_timeout_ms = -1)
+
+
     #########################################################################
     # Test the bundleresthandler base class
     # - copy N (configured) tuples from global queue
@@ -192,13 +282,16 @@ class Test(unittest.TestCase):
         print("############# test_WmlBundleRestHandler_preprocess() ###############")
 
         #create instance by copying from a source_list
-        source_list = [{"a":i} for i in range(10)]
+        source_list = BundleQueue([{"a":i} for i in range(10)])
 
         #set class variables
         BundleRestHandler.max_copy_size = 2
         #lock = threading.Lock()
-        lock = threading.Condition()
+        queue_lock = threading.Lock()
+        lock = threading.Condition(queue_lock)
         BundleRestHandler.input_list_lock = lock
+        # the space condition shares the lock of input_list_lock
+        BundleRestHandler.input_list_space = threading.Condition(queue_lock)
         BundleRestHandler.source_data_list = source_list
         BundleRestHandler.field_mapping = []
         BundleRestHandler.output_function = (lambda x: print(str( x)))
@@ -216,7 +309,108 @@ class Test(unittest.TestCase):
         #print ("local_list 2: ", test_store2._data_list)
         print("    check source list length after copy: handler 2")
         assert len(source_list) == 4
-        
+        print("    check oldest data copied first")
+        assert [{"a":i} for i in range(2,6)] == test_store2._data_list
+        BundleRestHandler.input_list_space = None
+
+
+    #########################################################################
+    # Test the final data of the bundleresthandler base class
+    # - input data is copied unless the handler owns it
+    # - owned input data is extended in place
+    # - success and error data are separated by the status message
+    #########################################################################
+    def test_BundleRestHandler_final_data(self):
+        print("############# test_BundleRestHandler_final_data() ###############")
+
+        class final_data_handler(BundleRestHandler):
+            pass
+        source_list = BundleQueue([{"a":i} for i in range(6)])
+        final_data_handler.max_copy_size = 3
+        final_data_handler.input_list_lock = threading.Condition()
+        final_data_handler.input_list_space = None
+        final_data_handler.bundle_sizer = None
+        final_data_handler.reorder_buffer = None
+        final_data_handler.source_data_list = source_list
+        final_data_handler.field_mapping = []
+        final_data_handler.output_function = (lambda x: print(str( x)))
+
+        print("    check input data is copied")
+        test_store1 = final_data_handler(1)
+        test_store1.copy_from_source()
+        input_data = list(test_store1._data_list)
+        for index in range(3):
+            test_store1._result_list[index] = {"Prediction": index}
+        test_store1.get_bundle_state().set_message(1, "error")
+        success, error = test_store1.get_final_data(single_list = False)
+        assert [{"a":0, "Prediction":0}, {"a":2, "Prediction":2}] == success
+        assert [{"a":1, "Prediction":1}] == error
+        assert [{"a":i} for i in range(3)] == input_data
+        assert success[0] is not input_data[0]
+
+        print("    check owned input data is extended in place")
+        final_data_handler.owns_input_data = True
+        test_store1.copy_from_source()
+        input_data = list(test_store1._data_list)
+        for index in range(3):
+            test_store1._result_list[index] = {"Prediction": index}
+        [output] = test_store1.get_final_data()
+        assert [{"a":i + 3, "Prediction":i} for i in range(3)] == output
+        assert all(data is final for data, final in zip(input_data, output))
+        success, error = test_store1.get_final_data(single_list = False)
+        assert output == success and [] == error
+
+        print("    check output fields projection")
+        final_data_handler.output_fields = ("b", "a")
+        source_list.extend([{"a":6, "b":7, "c":8}, {"b":9, "c":10}])
+        test_store1.copy_from_source()
+        test_store1._result_list[:] = [{"Prediction": 0}, {"PredictionError": "error"}]
+        [output] = test_store1.get_final_data()
+        assert [{"a":6, "b":7, "Prediction":0}, {"b":9, "PredictionError":"error"}] == output
+        assert "c" in test_store1._data_list[0]
+
+
+    #########################################################################
+    # Test the input queue used between controller and handlers
+    # - bundles are taken from the front in input order
+    # - full indication with max_size
+    #########################################################################
+    def test_BundleQueue(self):
+        print("############# test_BundleQueue() ###############")
+
+        queue = BundleQueue(max_size = 5)
+        for i in range(6):
+            print("    check queue not full with %d elements" % len(queue))
+            assert not queue.is_full()
+            queue.append(i)
+        print("    check queue full with max_size + 1 elements")
+        assert queue.is_full()
+
+        print("    check bundle taken from front")
+        assert [0, 1, 2, 3] == queue.pop_bundle(4)
+        assert not queue.is_full()
+        print("    check remaining elements taken even if bundle is larger")
+        assert [4, 5] == queue.pop_bundle(4)
+        assert [] == queue.pop_bundle(4)
+        assert len(queue) == 0
+
+        print("    check unbounded queue")
+        queue = BundleQueue(range(10000))
+        assert not queue.is_full()
+        assert list(range(100)) == queue.pop_bundle(100)
+        assert len(queue) == 9900
+
+        print("    check bundle filled into reused list")
+        bundle = ["old"] * 150
+        assert 100 == queue.pop_bundle_into(bundle, 100)
+        assert list(range(100, 200)) == bundle
+        assert 120 == queue.pop_bundle_into(bundle, 120)
+        assert list(range(200, 320)) == bundle
+        queue = BundleQueue(range(3), track_arrival = True)
+        assert 3 == queue.pop_bundle_into(bundle, 5)
+        assert [0, 1, 2] == bundle
+        assert queue.oldest_arrival() is None
+
 
 
     #########################################################################
@@ -242,7 +436,7 @@ class Test(unittest.TestCase):
 
         print("    ###### test with valid input only")
         # list of 10 valid tuples
-        source_list = [{"a":i, "b": i+1, "c": i+2} for i in range(10)]
+        source_list = BundleQueue([{"a":i, "b": i+1, "c": i+2} for i in range(10)])
 
         ###################################################
         #initialize the handler class
@@ -252,6 +446,7 @@ class Test(unittest.TestCase):
         #lock = threading.Lock()
         lock = threading.Condition()
         WmlBundleRestHandler.input_list_lock = lock
+        WmlBundleRestHandler.input_list_space = None
         WmlBundleRestHandler.source_data_list = source_list
         WmlBundleRestHandler.single_output = False
         WmlBundleRestHandler.field_mapping=[{"model_field":"a_",
@@ -289,7 +484,7 @@ class Test(unittest.TestCase):
         print("    ####### test with valid and invalid input #######")
     
         # mixed list of 10 valid and invalid tuples
-        source_list = [{"a":i, "b": i+1, "c": i+2} for i in range(10)]
+        source_list = BundleQueue([{"a":i, "b": i+1, "c": i+2} for i in range(10)])
         source_list[4].pop("b")
         source_list[2].pop("a")
         source_list[8].pop("b")
@@ -335,6 +530,173 @@ class Test(unittest.TestCase):
         assert len(source_list) == 0
 
 
+    #########################################################################
+    # Test the processing status of the input data of a bundle
+    # - mapped indices exclude the input data with mapping error
+    # - a failed request keeps the messages set before
+    # - reset() reuses the state for the next bundle of any size
+    #########################################################################
+    def test_BundleState(self):
+
+        print("############# test_BundleState() ###############")
+
+        state = BundleState()
+        state.reset(4)
+        state.set_mapped(0)
+        state.set_mapping_error(1, "mapping error")
+        state.set_mapped(2)
+        state.set_mapped(3)
+        assert [0, 2, 3] == state.get_mapped_indices()
+        state.set_message(2, "rejected")
+        state.set_score_result(True)
+        expected_status = [{'mapping_success': True, 'score_success': True, 'message': None}, 
+                           {'mapping_success': False, 'score_success': False, 'message': 'mapping error'}, 
+                           {'mapping_success': True, 'score_success': False, 'message': 'rejected'}, 
+                           {'mapping_success': True, 'score_success': True, 'message': None}
+                          ]
+        assert expected_status == state.get_status()
+
+        print("    check failed request keeps former messages")
+        state.set_score_result(False, "request error")
+        assert ["request error", "mapping error", "rejected", "request error"] == [item["message"] for item in state.get_status()]
+        assert not any(item["score_success"] for item in state.get_status())
+
+        print("    check reset reuses the state for a smaller bundle")
+        flags = state.mapping_success
+        state.reset(2)
+        assert flags is state.mapping_success
+        assert [{'mapping_success': False, 'score_success': False, 'message': None}] * 2 == state.get_status()
+        state.reset(0)
+        assert [] == state.get_status() and [] == state.get_mapped_indices()
+
+        print("    check varying bundle sizes don't keep allocations")
+        state.reset(1000)
+        tracemalloc.start()
+        try:
+            start, _ = tracemalloc.get_traced_memory()
+            for size in range(1000, 0, -1):
+                state.reset(size)
+            current, _ = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert current - start < 1024
+        assert bytearray(1) == state.mapping_success
+
+
+    #########################################################################
+    # Test the compiled field mapping
+    # - values are taken in model field order
+    # - missing and None values are invalid, first failing field is reported
+    # - '__array__' combined with other mappings is always invalid
+    # - the handler uses the plan of its actual field_mapping
+    #########################################################################
+    def test_FieldMappingPlan(self):
+
+        print("############# test_FieldMappingPlan() ###############")
+
+        plan = FieldMappingPlan([{"model_field":"b_", "tuple_field":"b"}, {"model_field":"a_", "tuple_field":"a"}])
+        assert not plan.array_mode
+        assert ['b_', 'a_'] == plan.model_fields
+        assert (2, 1) == plan.map_values({"a":1, "b":2, "c":3})
+        assert plan.map_values({"a":1}) is None
+        assert "b" == plan.get_error_field({"a":1})
+        assert plan.map_values({"a":None, "b":2}) is None
+        assert "a" == plan.get_error_field({"a":None, "b":2})
+
+        plan = FieldMappingPlan([{"model_field":"a_", "tuple_field":"a"}])
+        assert (numpy.nan,) == plan.map_values({"a":numpy.nan})
+        assert plan.map_values({"b":1}) is None
+
+        plan = FieldMappingPlan([{"model_field":"__array__", "tuple_field":"a"}])
+        assert plan.array_mode
+
+        print("    check empty field mapping")
+        plan = FieldMappingPlan([])
+        assert not plan.array_mode
+        assert [] == plan.model_fields
+        assert () == plan.map_values({"a":1})
+        assert plan.get_error_field({"a":1}) is None
+
+        plan = FieldMappingPlan([{"model_field":"b_", "tuple_field":"b"}, {"model_field":"__array__", "tuple_field":"a"}])
+        assert not plan.array_mode
+        assert plan.map_values({"a":[1], "b":2}) is None
+        assert "a" == plan.get_error_field({"a":[1], "b":2})
+        assert "b" == plan.get_error_field({"a":[1]})
+
+        print("    check handler compiles plan for changed field_mapping")
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = BundleQueue([{"a":i, "b": i+1} for i in range(4)])
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.max_copy_size = 2
+        WmlBundleRestHandler.field_mapping = [{"model_field":"a_", "tuple_field":"a"}]
+        WmlBundleRestHandler.field_mapping_plan = FieldMappingPlan(WmlBundleRestHandler.field_mapping)
+        self.addCleanup(setattr, WmlBundleRestHandler, "field_mapping_plan", None)
+        test_store1 = WmlBundleRestHandler(1)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'fields': ['a_'], 'values': [[0], [1]]}] == test_store1.get_payload()
+        WmlBundleRestHandler.field_mapping = [{"model_field":"b_", "tuple_field":"b"}]
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'fields': ['b_'], 'values': [[3], [4]]}] == test_store1.get_payload()
+
+
+    #########################################################################
+    # Test the vectorized mapping of numeric input data
+    # - values of the bundle are one float64 array
+    # - None, NaN and missing fields are mapping errors
+    # - bundles with non numeric values are mapped as usual
+    #########################################################################
+    def test_WmlBundleRestHandler_numeric_input(self):
+
+        print("############# test_WmlBundleRestHandler_numeric_input() ###############")
+
+        source_list = BundleQueue([{"a":i, "b": i+0.5} for i in range(20)])
+        source_list[1]["a"] = None
+        source_list[2]["b"] = numpy.nan
+        source_list[3].pop("a")
+        source_list[4]["a"] = numpy.int64(4)
+        source_list[7]["b"] = "text"
+        source_list[12]["b"] = "12.5"
+        source_list[16]["a"] = True
+
+        WmlBundleRestHandler.max_copy_size = 5
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
+                                            {"model_field":"b_", "tuple_field":"b"}]
+        WmlBundleRestHandler.numeric_input = True
+        self.addCleanup(setattr, WmlBundleRestHandler, "numeric_input", False)
+
+        test_store1 = WmlBundleRestHandler(1)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        payload = test_store1.get_payload()
+        assert ['a_', 'b_'] == payload[0]['fields']
+        assert isinstance(payload[0]['values'], numpy.ndarray)
+        assert numpy.float64 == payload[0]['values'].dtype
+        assert [[0.0, 0.5], [4.0, 4.5]] == payload[0]['values'].tolist()
+        expected_messages = [None, 'Mapping error: input field: a', 'Mapping error: input field: b', 'Mapping error: input field: a', None]
+        assert expected_messages == [item["message"] for item in test_store1.get_status()]
+        assert [True, False, False, False, True] == [item["mapping_success"] for item in test_store1.get_status()]
+
+        print("    check bundle with non numeric value")
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'fields': ['a_', 'b_'], 'values': [[5, 5.5], [6, 6.5], [7, "text"], [8, 8.5], [9, 9.5]]}] == test_store1.get_payload()
+
+        print("    check numeric string and bool aren't converted")
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'fields': ['a_', 'b_'], 'values': [[10, 10.5], [11, 11.5], [12, "12.5"], [13, 13.5], [14, 14.5]]}] == test_store1.get_payload()
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'fields': ['a_', 'b_'], 'values': [[15, 15.5], [True, 16.5], [17, 17.5], [18, 18.5], [19, 19.5]]}] == test_store1.get_payload()
+
+
     #########################################################################
     # Test the WML bundleresthandler class and underlying base class
     #
@@ -365,7 +727,7 @@ class Test(unittest.TestCase):
 
         print("    ##### test with valid and invalid input ")
         # list of 10 tuples, 5 valid + 5 mixed
-        source_list = [{"a":i, "b": i+1, "c": i+2} for i in range(10)]
+        source_list = BundleQueue([{"a":i, "b": i+1, "c": i+2} for i in range(10)])
         source_list[5].pop("a")
         source_list[8].pop("b")
         source_list[8].pop("a")
@@ -378,6 +740,7 @@ class Test(unittest.TestCase):
         #lock = threading.Lock()
         lock = threading.Condition()
         WmlBundleRestHandler.input_list_lock = lock
+        WmlBundleRestHandler.input_list_space = None
         WmlBundleRestHandler.source_data_list = source_list
         WmlBundleRestHandler.single_output = False
         WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
@@ -497,6 +860,767 @@ class Test(unittest.TestCase):
         test_store1.write_result_to_output()
         
 
+    #########################################################################
+    # Test the results of a model with several outputs
+    # - the WML client stub responds with two prediction blocks
+    # - each scored input data gets one Prediction with the fields of 
+    #   both blocks, the invalid input data gets its PredictionError
+    #########################################################################
+    def test_WmlBundleRestHandler_prediction_blocks(self):
+
+        print("############# test_WmlBundleRestHandler_prediction_blocks() ###############")
+
+        class wml_client_stub ():
+            class deployments_():
+                def score(self,deployment_id, **meta_props):
+                    values = meta_props["meta_props"]["input_data"][0]["values"]
+                    return {'predictions': [{'fields': ['prediction'], 'values': [[value[0] * 10] for value in values]},
+                                            {'fields': ['probability', 'label'], 'values': [[0.5, "l" + str(value[0])] for value in values]}]}
+            deployments = deployments_()      
+
+        source_list = BundleQueue([{"a":i} for i in range(4)])
+        source_list[1].pop("a")
+        WmlBundleRestHandler.max_copy_size = 4
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"}]                                      
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.wml_client = wml_client_stub
+        WmlBundleRestHandler.deployment_guid = "deploymentid"
+
+        test_store1 = WmlBundleRestHandler(1)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        test_store1.synch_rest_call()
+        test_store1.postprocess()
+
+        expected_result = [{'Prediction': {'prediction': 0, 'probability': 0.5, 'label': 'l0'}},
+                           {'PredictionError': 'Mapping error: input field: a'},
+                           {'Prediction': {'prediction': 20, 'probability': 0.5, 'label': 'l2'}},
+                           {'Prediction': {'prediction': 30, 'probability': 0.5, 'label': 'l3'}}
+                          ]
+        print("    check merged prediction blocks")
+        assert expected_result == test_store1.get_postprocess_result()
+
+        print("    check values format")
+        self.addCleanup(setattr, WmlBundleRestHandler, "prediction_format", "dict")
+        self.addCleanup(setattr, WmlBundleRestHandler, "prediction_fields", None)
+        WmlBundleRestHandler.prediction_format = "values"
+        test_store1.postprocess()
+        expected_result = [{'Prediction': [0, 0.5, 'l0']},
+                           {'PredictionError': 'Mapping error: input field: a'},
+                           {'Prediction': [20, 0.5, 'l2']},
+                           {'Prediction': [30, 0.5, 'l3']}
+                          ]
+        assert expected_result == test_store1.get_postprocess_result()
+        assert ('prediction', 'probability', 'label') == WmlBundleRestHandler.prediction_fields
+        # single block values are taken from the response
+        test_store1._rest_response['predictions'].pop()
+        test_store1.postprocess()
+        assert test_store1.get_postprocess_result()[2]['Prediction'] is test_store1.get_rest_response()['predictions'][0]['values'][1]
+        assert ('prediction',) == WmlBundleRestHandler.prediction_fields
+
+
+    #########################################################################
+    # Test the scoring cache
+    # - least recently used entries are removed at max_size
+    # - entries expire after ttl
+    # - a changed model version removes all entries
+    #########################################################################
+    def test_ScoringCache(self):
+
+        print("############# test_ScoringCache() ###############")
+
+        cache = ScoringCache(max_size = 2, version_check_interval = None)
+        keys = [cache.make_key("deployment", row) for row in ([1, 2], [2, 3], [3, 4])]
+        assert keys[0] == cache.make_key("deployment", (1, 2))
+        assert keys[0] != cache.make_key("other", [1, 2])
+        assert cache.make_key("deployment", [[1], 2]) is None
+        assert cache.make_key("deployment", numpy.array([1.0, 2.0])) == cache.make_key("deployment", numpy.array([1.0, 2.0]))
+
+        print("    check least recently used entry removed")
+        assert [None, None] == cache.lookup(keys[:2])
+        cache.store([(keys[0], "p0"), (keys[1], "p1")])
+        assert ["p0", None] == cache.lookup([keys[0], None])
+        cache.store([(keys[2], "p2")])
+        assert ["p0", None, "p2"] == cache.lookup(keys)
+        assert {"size": 2, "hits": 3, "misses": 4, "invalidations": 0} == cache.get_statistics()
+
+        print("    check model version change")
+        assert not cache.is_version_check_due()
+        cache.set_model_version({"id": "model", "rev": "1"})
+        assert 2 == len(cache)
+        cache.set_model_version({"id": "model", "rev": "2"})
+        assert 0 == len(cache)
+        cache = ScoringCache(version_check_interval = 60)
+        assert cache.is_version_check_due()
+        assert not cache.is_version_check_due()
+
+        print("    check expired entry")
+        cache = ScoringCache(ttl = 0.01, version_check_interval = None)
+        cache.store([(keys[0], "p0")])
+        assert ["p0"] == cache.lookup([keys[0]])
+        time.sleep(0.02)
+        assert [None] == cache.lookup([keys[0]])
+        assert 0 == len(cache)
+
+
+    #########################################################################
+    # Test the scoring cache in the handler
+    # - only input data with values not cached are sent for scoring
+    # - a bundle with cached values only is not sent at all
+    # - a failing request doesn't reject input data with cached predictions
+    #########################################################################
+    def test_WmlBundleRestHandler_scoring_cache(self):
+
+        print("############# test_WmlBundleRestHandler_scoring_cache() ###############")
+
+        class wml_client_stub ():
+            sent = []
+            fail = False
+            class deployments_():
+                def score(self,deployment_id, **meta_props):
+                    values = meta_props["meta_props"]["input_data"][0]["values"]
+                    wml_client_stub.sent.append([value[0] for value in values])
+                    if wml_client_stub.fail:
+                        raise WMLClientError("scoring failed")
+                    return {'predictions': [{'fields': ['prediction'], 'values': [[value[0] * 10] for value in values]}]}
+                def get_details(self, deployment_id):
+                    return {'entity': {'asset': {'id': 'model'}}}
+            deployments = deployments_()      
+
+        source_list = BundleQueue([{"a":i} for i in [1, 2, 3]] + [{"a":i} for i in [2, 4, 3]] + [{"a":i} for i in [4, 1, 2]] + [{"a":i} for i in [5, 1]])
+        source_list[4].pop("a")
+        self.addCleanup(setattr, WmlBundleRestHandler, "scoring_cache", None)
+        WmlBundleRestHandler.scoring_cache = ScoringCache()
+        WmlBundleRestHandler.max_copy_size = 3
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.single_output = False
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"}]                                      
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.wml_client = wml_client_stub
+        WmlBundleRestHandler.deployment_guid = "deploymentid"
+
+        test_store1 = WmlBundleRestHandler(1)
+        results = []
+        for index in range(4):
+            wml_client_stub.fail = index == 3
+            test_store1.copy_from_source()
+            test_store1.preprocess()
+            test_store1.synch_rest_call()
+            test_store1.postprocess()
+            results.append(list(test_store1.get_postprocess_result()))
+
+        print("    check only values not cached are sent")
+        assert [[1, 2, 3], [4], [5]] == wml_client_stub.sent
+        assert [{'Prediction': {'prediction': 20}}, {'PredictionError': 'Mapping error: input field: a'}, {'Prediction': {'prediction': 30}}] == results[1]
+        assert [{'Prediction': {'prediction': 40}}, {'Prediction': {'prediction': 10}}, {'Prediction': {'prediction': 20}}] == results[2]
+        print("    check failed request keeps cached predictions")
+        assert [{'PredictionError': 'WML API error: scoring failed'}, {'Prediction': {'prediction': 10}}] == results[3]
+        success, error = test_store1.get_final_data(single_list = False)
+        assert [{"a":1, 'Prediction': {'prediction': 10}}] == success
+        assert {"size": 4, "hits": 5, "misses": 5, "invalidations": 0} == WmlBundleRestHandler.scoring_cache.get_statistics()
+
+
+    #########################################################################
+    # Test the isolation of invalid input data in a rejected bundle
+    #
+    # - the WML client stub rejects each request containing a negative value
+    #   with status 400, like WML does for invalid input
+    # - only the input data with negative value get a PredictionError
+    # - the accepted parts are merged in input order
+    #########################################################################
+    def test_WmlBundleRestHandler_isolate_invalid_input(self):
+
+        print("############# test_WmlBundleRestHandler_isolate_invalid_input() ###############")
+
+        class response_stub():
+            def __init__(self, status_code):
+                self.status_code = status_code
+
+        class rejected_error(WMLClientError):
+            def __init__(self, error_msg, response):
+                WMLClientError.__init__(self, error_msg, logg_messages = False)
+                self.response = response
+
+        class wml_client_stub ():
+            class deployments_():
+                def __init__(self):
+                    self.requests = []
+                def score(self,deployment_id, **meta_props):
+                    values = meta_props["meta_props"]["input_data"][0]["values"]
+                    self.requests.append(values)
+                    if any(value[0] < 0 for value in values):
+                        raise rejected_error("Invalid input", response_stub(400))
+                    return {'predictions': [{'fields': ['prediction$1'], 'values': [[value[0] * 10] for value in values]}]}
+            def __init__(self):
+                self.deployments = self.deployments_()
+
+        # 16 tuples, 2 invalid for WML, 1 invalid for mapping
+        source_list = BundleQueue([{"a":i, "b": i+1} for i in range(16)])
+        source_list[3]["a"] = -3
+        source_list[12]["a"] = -12
+        source_list[6].pop("b")
+
+        WmlBundleRestHandler.max_copy_size = 16
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.single_output = False
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
+                                            {"model_field":"b_", "tuple_field":"b"}]
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.wml_client = wml_client_stub()
+        WmlBundleRestHandler.deployment_guid = "deploymentid"
+        WmlBundleRestHandler.isolate_invalid_input = True
+        self.addCleanup(setattr, WmlBundleRestHandler, "isolate_invalid_input", False)
+
+        test_store1 = WmlBundleRestHandler(1)
+        assert 16 == test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 1 == test_store1.synch_rest_call()
+        # whole bundle, 2 halves, 4 quarters, 4 eighths, 4 single
+        requests = WmlBundleRestHandler.wml_client.deployments.requests
+        assert 15 == len(requests)
+        assert 15 == len(requests[0])
+        test_store1.postprocess()
+        for index, result in enumerate(test_store1.get_postprocess_result()):
+            if index in (3, 12):
+                assert result['PredictionError'].startswith("WML API error: Invalid input")
+            elif index == 6:
+                assert "Mapping error: input field: b" == result['PredictionError']
+            else:
+                assert {'Prediction': {'prediction$1': index * 10}} == result
+        success, error = test_store1.get_final_data(single_list = False)
+        assert 13 == len(success)
+        assert 3 == len(error)
+
+        print("    check single invalid input data isn't split")
+        source_list.append({"a":-1, "b": 0})
+        assert 1 == test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 0 == test_store1.synch_rest_call()
+        assert 16 == len(requests)
+        test_store1.postprocess()
+        assert test_store1.get_postprocess_result()[0]['PredictionError'].startswith("WML API error: Invalid input")
+
+        print("    check isolation stops if halves and quarters are rejected")
+        WmlBundleRestHandler.max_copy_size = 100
+        source_list.extend([{"a":-i - 1, "b": i} for i in range(100)])
+        assert 100 == test_store1.copy_from_source()
+        test_store1.preprocess()
+        del requests[:]
+        assert 0 == test_store1.synch_rest_call()
+        # whole bundle, 2 halves, 4 quarters
+        assert 7 == len(requests)
+        test_store1.postprocess()
+        for result in test_store1.get_postprocess_result():
+            assert result['PredictionError'].startswith("WML API error: Invalid input")
+
+        print("    check isolation stops after max requests")
+        source_list.extend([{"a":-i if i in (1, 21, 42) else i, "b": i} for i in range(64)])
+        assert 64 == test_store1.copy_from_source()
+        test_store1.preprocess()
+        del requests[:]
+        assert 1 == test_store1.synch_rest_call()
+        assert 1 + 4 * 64 .bit_length() == len(requests)
+        test_store1.postprocess()
+        results = test_store1.get_postprocess_result()
+        for index in (1, 21, 42):
+            assert results[index]['PredictionError'].startswith("WML API error: Invalid input")
+        assert {'Prediction': {'prediction$1': 630}} == results[63]
+
+
+    #########################################################################
+    # Test the retry of scoring requests failing with transient errors
+    #
+    # - the WML client stub fails with the given status codes before it
+    #   returns the predictions
+    # - transient errors are retried up to max_attempts
+    # - other errors are not retried
+    #########################################################################
+    def test_WmlBundleRestHandler_retry(self):
+
+        print("############# test_WmlBundleRestHandler_retry() ###############")
+
+        class response_stub():
+            def __init__(self, status_code):
+                self.status_code = status_code
+
+        class failed_error(WMLClientError):
+            def __init__(self, error_msg, response):
+                WMLClientError.__init__(self, error_msg, logg_messages = False)
+                self.response = response
+
+        class wml_client_stub ():
+            class deployments_():
+                def __init__(self):
+                    self.failures = []
+                    self.attempts = 0
+                def score(self,deployment_id, **meta_props):
+                    self.attempts += 1
+                    if self.failures:
+                        failure = self.failures.pop(0)
+                        if isinstance(failure, Exception):
+                            raise failure
+                        raise failed_error("Failure with status " + str(failure), response_stub(failure))
+                    values = meta_props["meta_props"]["input_data"][0]["values"]
+                    return {'predictions': [{'fields': ['prediction$1'], 'values': [[value[0] * 10] for value in values]}]}
+            def __init__(self):
+                self.deployments = self.deployments_()
+
+        print("    check backoff delays")
+        policy = RetryPolicy(max_attempts = 5, backoff_base = 0.1, backoff_cap = 0.3, jitter = False)
+        assert [0.1, 0.2, 0.3, 0.3] == [policy.get_delay(attempt) for attempt in range(1, 5)]
+        policy.jitter = True
+        for attempt in range(1, 5):
+            assert 0 <= policy.get_delay(attempt) <= 0.3
+
+        source_list = BundleQueue([{"a":i, "b": i+1} for i in range(20)])
+
+        WmlBundleRestHandler.max_copy_size = 5
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.single_output = False
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
+                                            {"model_field":"b_", "tuple_field":"b"}]
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.wml_client = wml_client_stub()
+        WmlBundleRestHandler.deployment_guid = "deploymentid"
+        WmlBundleRestHandler.retry_policy = RetryPolicy(max_attempts = 3, backoff_base = 0.0, backoff_cap = 0.0)
+        self.addCleanup(setattr, WmlBundleRestHandler, "retry_policy", None)
+        deployments = WmlBundleRestHandler.wml_client.deployments
+
+        test_store1 = WmlBundleRestHandler(1)
+
+        print("    check transient errors are retried")
+        deployments.failures = [503, requests.exceptions.ConnectionError("connection reset")]
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 1 == test_store1.synch_rest_call()
+        assert 3 == deployments.attempts
+        test_store1.postprocess()
+        assert [{'Prediction': {'prediction$1': i * 10}} for i in range(5)] == test_store1.get_postprocess_result()
+
+        print("    check request fails after max attempts")
+        deployments.attempts = 0
+        deployments.failures = [429, 429, 429]
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 0 == test_store1.synch_rest_call()
+        assert 3 == deployments.attempts
+        test_store1.postprocess()
+        for result in test_store1.get_postprocess_result():
+            assert result['PredictionError'].startswith("WML API error: Failure with status 429")
+
+        print("    check invalid input isn't retried")
+        deployments.attempts = 0
+        deployments.failures = [400]
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 0 == test_store1.synch_rest_call()
+        assert 1 == deployments.attempts
+
+        print("    check no retry after stop")
+        deployments.attempts = 0
+        deployments.failures = [503]
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        test_store1.stop()
+        assert 0 == test_store1.synch_rest_call()
+        assert 1 == deployments.attempts
+
+
+    #########################################################################
+    # Test the asyncio variant of the WML bundleresthandler
+    #
+    # - slots are created for max_in_flight bundles
+    # - asynch_rest_call() with a session stub instead of aiohttp session
+    #   delivering a certain result or an error status
+    # - postprocess() results are the same as for synch_rest_call()
+    #########################################################################
+    def test_WmlAsyncBundleRestHandler_asynch_rest_call(self):
+
+        print("############# test_WmlAsyncBundleRestHandler_asynch_rest_call() ###############")
+
+        class response_stub():
+            def __init__(self, status, result):
+                self.status = status
+                self._result = result
+            async def __aenter__(self):
+                return self
+            async def __aexit__(self, *args):
+                return False
+            async def read(self):
+                return json.dumps(self._result).encode('utf-8')
+            async def text(self):
+                return str(self._result)
+
+        class session_stub():
+            def __init__(self, status):
+                self._status = status
+                self.requests = []
+            def post(self, url, params, headers, data):
+                payload = json.loads(data)
+                self.requests.append(payload)
+                values = payload["input_data"][0]["values"]
+                return response_stub(self._status, {'predictions': [{'fields': ['prediction$1'], 'values': [[value[0] * 10] for value in values]}]})
+
+        class endpoint_stub():
+            url = "https://wml/ml/v4/deployments/deploymentid/predictions"
+            params = {"version":"2020-08-01"}
+            headers = {}
+
+        source_list = BundleQueue([{"a":i, "b": i+1} for i in range(10)])
+        source_list[1].pop("a")
+
+        WmlAsyncBundleRestHandler.max_copy_size = 5
+        WmlAsyncBundleRestHandler.input_list_lock = threading.Condition()
+        WmlAsyncBundleRestHandler.input_list_space = None
+        WmlAsyncBundleRestHandler.source_data_list = source_list
+        WmlAsyncBundleRestHandler.single_output = False
+        WmlAsyncBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
+                                                 {"model_field":"b_", "tuple_field":"b"}]
+        WmlAsyncBundleRestHandler.output_function = output_class(self)
+        WmlAsyncBundleRestHandler.scoring_endpoint = endpoint_stub()
+        WmlAsyncBundleRestHandler.max_in_flight = 3
+
+        test_store1 = WmlAsyncBundleRestHandler(1)
+        print("    check slots created for max_in_flight")
+        assert 3 == len(test_store1._slots)
+        assert test_store1 is test_store1._slots[0]
+
+        print("    check client timeout")
+        assert test_store1._get_client_timeout().sock_read is None
+        WmlAsyncBundleRestHandler.request_timeout = (10.0, 60.0)
+        self.addCleanup(setattr, WmlAsyncBundleRestHandler, "request_timeout", None)
+        client_timeout = test_store1._get_client_timeout()
+        assert (None, 10.0, 60.0) == (client_timeout.total, client_timeout.sock_connect, client_timeout.sock_read)
+
+        print("    check successful request")
+        loop = asyncio.new_event_loop()
+        session = session_stub(200)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        loop.run_until_complete(test_store1.asynch_rest_call(session))
+        assert [{'input_data': [{'fields': ['a_', 'b_'], 'values': [[0, 1], [2, 3], [3, 4], [4, 5]]}]}] == session.requests
+        test_store1.postprocess()
+        expected_result = [{'Prediction': {'prediction$1': 0}},
+                           {'PredictionError': 'Mapping error: input field: a'},
+                           {'Prediction': {'prediction$1': 20}},
+                           {'Prediction': {'prediction$1': 30}},
+                           {'Prediction': {'prediction$1': 40}}
+                          ]
+        assert expected_result == test_store1.get_postprocess_result()
+
+        print("    check rejected request")
+        session = session_stub(400)
+        test_store2 = test_store1._slots[1]
+        test_store2.copy_from_source()
+        test_store2.preprocess()
+        loop.run_until_complete(test_store2.asynch_rest_call(session))
+        loop.close()
+        assert test_store2.get_rest_response() is None
+        test_store2.postprocess()
+        for result in test_store2.get_postprocess_result():
+            assert result['PredictionError'].startswith("WML API error: Scoring request failed with status 400")
+
+        print("    check stop of handler stops all slots")
+        test_store1.stop()
+        for slot in test_store1._slots:
+            assert not slot._run
+
+
+    #########################################################################
+    # Test the event loop of the asyncio variant with an aiohttp session
+    # stub delivering the responses with varying latency
+    #
+    # - concurrent requests are limited by max_in_flight
+    # - results are written in input order through the reorder buffer,
+    #   slots outside its window wait without blocking the other slots
+    # - stop() ends the handler thread
+    #########################################################################
+    def test_WmlAsyncBundleRestHandler_run(self):
+
+        print("############# test_WmlAsyncBundleRestHandler_run() ###############")
+
+        in_flight = [0, 0]  # current, max
+        class response_stub():
+            def __init__(self, values):
+                self.status = 200
+                self._values = values
+            async def __aenter__(self):
+                in_flight[0] += 1
+                in_flight[1] = max(in_flight)
+                # varying latency, so bundles complete out of order
+                await asyncio.sleep((self._values[0][0] % 7) * 0.001)
+                return self
+            async def __aexit__(self, *args):
+                in_flight[0] -= 1
+                return False
+            async def read(self):
+                return json.dumps({'predictions': [{'fields': ['prediction$1'], 'values': [[value[0] * 10] for value in self._values]}]}).encode('utf-8')
+
+        class session_stub():
+            def __init__(self, connector, timeout):
+                pass
+            async def __aenter__(self):
+                return self
+            async def __aexit__(self, *args):
+                return False
+            def post(self, url, params, headers, data):
+                return response_stub(json.loads(data)["input_data"][0]["values"])
+
+        aiohttp = wmlasyncbundleresthandler.aiohttp
+        self.addCleanup(setattr, aiohttp, "ClientSession", aiohttp.ClientSession)
+        aiohttp.ClientSession = session_stub
+
+        class endpoint_stub():
+            url = "https://wml/ml/v4/deployments/deploymentid/predictions"
+            params = {"version":"2020-08-01"}
+            headers = {}
+            verify = True
+
+        results = []
+        output_done = threading.Condition()
+        class output_function():
+            def __call__(self, result_lists):
+                with output_done:
+                    results.extend(result_lists[0])
+                    output_done.notify_all()
+
+        class run_handler(WmlAsyncBundleRestHandler):
+            pass
+        run_handler.max_copy_size = 5
+        run_handler.input_list_lock = threading.Condition()
+        run_handler.input_list_space = None
+        run_handler.source_data_list = BundleQueue([{"a":i} for i in range(500)])
+        run_handler.single_output = True
+        run_handler.field_mapping = [{"model_field":"a_", "tuple_field":"a"}]
+        run_handler.scoring_endpoint = endpoint_stub()
+        run_handler.output_function = output_function()
+        run_handler.reorder_buffer = ReorderBuffer(run_handler.output_function, window = 2)
+        run_handler.max_in_flight = 4
+        handler = run_handler(0)
+
+        thread = threading.Thread(target = handler.run)
+        thread.start()
+        self.addCleanup(handler.stop)
+
+        print("    check results are written in order")
+        with output_done:
+            assert output_done.wait_for(lambda : len(results) == 500, 10.0)
+        assert [{'a': i, 'Prediction': {'prediction$1': i * 10}} for i in range(500)] == results
+
+        print("    check concurrent requests limited by max_in_flight")
+        assert 1 < in_flight[1] <= 4
+
+        print("    check stop ends the handler thread")
+        handler.stop()
+        thread.join(5.0)
+        assert not thread.is_alive()
+
+
+    #########################################################################
+    # Test the WML bundleresthandler sending requests directly to the
+    # scoring endpoint instead of using the WML client
+    #
+    # - synch_rest_call() with a requests session stub 
+    # - headers are refreshed once on 401 status
+    # - error status rejects the bundle
+    #########################################################################
+    def test_WmlBundleRestHandler_direct_transport(self):
+
+        print("############# test_WmlBundleRestHandler_direct_transport() ###############")
+
+        class response_stub():
+            def __init__(self, status_code, result):
+                self.status_code = status_code
+                self._result = result
+                self.text = str(result)
+                self.content = json.dumps(result).encode('utf-8')
+
+        class session_stub():
+            def __init__(self, status_codes):
+                self._status_codes = status_codes
+                self.requests = []
+            def post(self, url, params, headers, data, verify, timeout):
+                if headers.get("Content-Encoding") == "gzip":
+                    data = gzip.decompress(data)
+                payload = json.loads(data)
+                self.requests.append((url, params, headers, payload))
+                self.timeout = timeout
+                values = payload["input_data"][0]["values"]
+                return response_stub(self._status_codes.pop(0), {'predictions': [{'fields': ['prediction$1'], 'values': [[value[0] * 10] for value in values]}]})
+
+        class endpoint_stub():
+            url = "https://wml/ml/v4/deployments/deploymentid/predictions"
+            params = {"version":"2020-08-01"}
+            headers = {"Authorization":"Bearer old"}
+            verify = True
+            def refresh_headers(self, rejected_headers):
+                self.headers = {"Authorization":"Bearer new"}
+                return self.headers
+
+        source_list = BundleQueue([{"a":i, "b": i+1} for i in range(10)])
+
+        WmlBundleRestHandler.max_copy_size = 5
+        WmlBundleRestHandler.input_list_lock = threading.Condition()
+        WmlBundleRestHandler.input_list_space = None
+        WmlBundleRestHandler.source_data_list = source_list
+        WmlBundleRestHandler.single_output = False
+        WmlBundleRestHandler.field_mapping=[{"model_field":"a_", "tuple_field":"a"},
+                                            {"model_field":"b_", "tuple_field":"b"}]
+        WmlBundleRestHandler.output_function = output_class(self)
+        WmlBundleRestHandler.scoring_endpoint = endpoint_stub()
+        self.addCleanup(setattr, WmlBundleRestHandler, "scoring_endpoint", None)
+        self.addCleanup(setattr, WmlBundleRestHandler, "scoring_session", None)
+
+        print("    check successful request after header refresh")
+        session = session_stub([401, 200])
+        WmlBundleRestHandler.scoring_session = session
+        test_store1 = WmlBundleRestHandler(1)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 1 == test_store1.synch_rest_call()
+        assert 2 == len(session.requests)
+        assert "Bearer old" == session.requests[0][2]["Authorization"]
+        assert "Bearer new" == session.requests[1][2]["Authorization"]
+        assert "Content-Encoding" not in session.requests[1][2]
+        assert session.timeout is None
+        assert {'input_data': [{'fields': ['a_', 'b_'], 'values': [[0, 1], [1, 2], [2, 3], [3, 4], [4, 5]]}]} == session.requests[1][3]
+        test_store1.postprocess()
+        assert [{'Prediction': {'prediction$1': i * 10}} for i in range(5)] == test_store1.get_postprocess_result()
+
+        print("    check compressed request")
+        session = session_stub([200])
+        WmlBundleRestHandler.scoring_session = session
+        WmlBundleRestHandler.compression_threshold = 10
+        self.addCleanup(setattr, WmlBundleRestHandler, "compression_threshold", None)
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 1 == test_store1.synch_rest_call()
+        assert "gzip" == session.requests[0][2]["Content-Encoding"]
+        assert {'input_data': [{'fields': ['a_', 'b_'], 'values': [[5, 6], [6, 7], [7, 8], [8, 9], [9, 10]]}]} == session.requests[0][3]
+
+        print("    check request timeout")
+        WmlBundleRestHandler.request_timeout = (10.0, 60.0)
+        self.addCleanup(setattr, WmlBundleRestHandler, "request_timeout", None)
+        source_list.extend([{"a":i, "b": i+1} for i in range(5)])
+        session = session_stub([200])
+        WmlBundleRestHandler.scoring_session = session
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 1 == test_store1.synch_rest_call()
+        assert (10.0, 60.0) == session.timeout
+
+        print("    check rejected request")
+        source_list.extend([{"a":i, "b": i+1} for i in range(5)])
+        session = session_stub([400])
+        WmlBundleRestHandler.scoring_session = session
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert 0 == test_store1.synch_rest_call()
+        test_store1.postprocess()
+        for result in test_store1.get_postprocess_result():
+            assert result['PredictionError'].startswith("WML API error: Scoring request failed with status 400")
+
+
+    #########################################################################
+    # Test the scoring endpoint resolved with the WML client
+    # - query parameters and headers come from the client, without space_id
+    # - a client without these functions gets a clear error
+    #########################################################################
+    def test_WmlScoringEndpoint(self):
+
+        print("############# test_WmlScoringEndpoint() ###############")
+
+        class deployments_stub():
+            def get_details(self, deployment_guid):
+                return {"deployment_guid": deployment_guid}
+            def get_scoring_href(self, details):
+                return "https://wml/" + details["deployment_guid"] + "/predictions"
+
+        class wml_client_stub():
+            version = "stub"
+            def __init__(self):
+                self.deployments = deployments_stub()
+                self.header_count = 0
+            def _params(self):
+                return {"version": "2020-09-01", "space_id": "space"}
+            def _get_headers(self):
+                self.header_count += 1
+                return {"Authorization": "Bearer " + str(self.header_count)}
+
+        wml_client = wml_client_stub()
+        endpoint = WmlScoringEndpoint(wml_client, "guid")
+        print("    check url, parameters and headers")
+        assert endpoint.url == "https://wml/guid/predictions"
+        assert endpoint.params == {"version": "2020-09-01"}
+        assert endpoint.headers == {"Authorization": "Bearer 1"}
+        print("    check headers refreshed once")
+        rejected = endpoint.headers
+        assert endpoint.refresh_headers(rejected) == {"Authorization": "Bearer 2"}
+        assert endpoint.refresh_headers(rejected) == {"Authorization": "Bearer 2"}
+
+        print("    check error for client with changed or without private functions")
+        class changed_client_stub():
+            version = "stub"
+            def __init__(self):
+                self.deployments = deployments_stub()
+            def _params(self, space_id):
+                return {}
+        with self.assertRaisesRegex(RuntimeError, "_params"):
+            WmlScoringEndpoint(changed_client_stub(), "guid")
+        changed_client_stub._params = lambda self: {}
+        with self.assertRaisesRegex(RuntimeError, "_get_headers"):
+            WmlScoringEndpoint(changed_client_stub(), "guid")
+
+
+    #########################################################################
+    # Test the payload serializers for requests sent directly
+    #
+    # - each installed JSON library encodes the numpy values of the 
+    #   '__array__' mapping and decodes the response
+    # - "auto" selects the fastest installed library
+    #########################################################################
+    def test_PayloadSerializer(self):
+
+        print("############# test_PayloadSerializer() ###############")
+
+        payload = {'input_data': [{'values': [numpy.array([1.5, 2.0, 3.25]), 
+                                              list(numpy.array([4, 5, 6], dtype = numpy.int32)),
+                                              numpy.arange(6, dtype = numpy.float32).reshape(2, 3)[:, 1],
+                                              [numpy.float64(0.5), numpy.bool_(True), "a", None]]}]}
+        expected = {'input_data': [{'values': [[1.5, 2.0, 3.25], [4, 5, 6], [1.0, 4.0], [0.5, True, "a", None]]}]}
+
+        for serializer_class in [OrjsonPayloadSerializer, UjsonPayloadSerializer, PayloadSerializer]:
+            if not serializer_class.is_available():
+                print("    serializer " + serializer_class.name + " not installed")
+                continue
+            print("    check serializer " + serializer_class.name)
+            serializer = get_serializer(serializer_class.name)
+            assert isinstance(serializer, serializer_class)
+            body = serializer.dumps(payload)
+            assert isinstance(body, bytes)
+            assert expected == json.loads(body)
+            assert expected == serializer.loads(body)
+            with self.assertRaises(TypeError):
+                serializer.dumps({'values': [object()]})
+
+        print("    check auto selection and unknown serializer")
+        for serializer_class in [OrjsonPayloadSerializer, UjsonPayloadSerializer, PayloadSerializer]:
+            if serializer_class.is_available():
+                assert isinstance(get_serializer("auto"), serializer_class)
+                break
+        with self.assertRaises(ValueError):
+            get_serializer("simplejson")
+
+
     def test_WmlBundleRestHandler_single_array_input(self):
 
         print("############# test_WmlBundleRestHandler_single_array_input() ###############")
@@ -513,7 +1637,7 @@ class Test(unittest.TestCase):
             deployments = deployments_()      
 
         # list of 10 tuples, 5 valid
-        source_list = [{"a":numpy.array([i+1,i+2,i+3,i+4,i+5]), "b": i+1, "c": i+2} for i in range(10)]
+        source_list = BundleQueue([{"a":numpy.array([i+1,i+2,i+3,i+4,i+5]), "b": i+1, "c": i+2} for i in range(10)])
 
         ###################################################
         #initialize the handler class
@@ -522,6 +1646,7 @@ class Test(unittest.TestCase):
         WmlBundleRestHandler.max_copy_size = 5
         lock = threading.Condition()
         WmlBundleRestHandler.input_list_lock = lock
+        WmlBundleRestHandler.input_list_space = None
         WmlBundleRestHandler.source_data_list = source_list
         WmlBundleRestHandler.single_output = False
         WmlBundleRestHandler.field_mapping=[{"model_field":"__array__", "tuple_field":"a"}]
@@ -536,10 +1661,12 @@ class Test(unittest.TestCase):
         test_store1 = WmlBundleRestHandler(1)
         test_store1.copy_from_source()
         test_store1.preprocess()
-        expected_payload = [{'values': [[1, 2, 3, 4, 5], [ 2, 3, 4, 5, 6], [3, 4, 5, 6, 7], [ 4, 5, 6, 7, 8], [ 5, 6, 7, 8, 9]]}]
+        expected_values = [[1, 2, 3, 4, 5], [ 2, 3, 4, 5, 6], [3, 4, 5, 6, 7], [ 4, 5, 6, 7, 8], [ 5, 6, 7, 8, 9]]
         print("    check expected payload: handler 1")
         #print(test_store1.get_payload())
-        assert expected_payload == test_store1.get_payload()
+        # numpy rows are stacked into one array
+        assert isinstance(test_store1.get_payload()[0]['values'], numpy.ndarray)
+        assert expected_values == test_store1.get_payload()[0]['values'].tolist()
         
         expected_status = [{'mapping_success': True, 'score_success': False, 'message': None}, 
                            {'mapping_success': True, 'score_success': False, 'message': None}, 
@@ -551,6 +1678,22 @@ class Test(unittest.TestCase):
         #print(test_store1.get_status())
         assert expected_status == test_store1.get_status()
 
+        print ("    ##### array.array, bytes and mixed row handling #####")
+        source_list.extend([{"a":array.array('d', [1.5, 2.5])},
+                            {"a":bytes([1, 2])},
+                            {"a":array.array('u', "ab")},
+                            {"a":numpy.array([3, 4])},
+                            {"a":"text"}])
+        test_store1.copy_from_source()
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [[1.5, 2.5], [1, 2], [3, 4]] == test_store1.get_payload()[0]['values'].tolist()
+        assert [True, True, False, True, False] == [item["mapping_success"] for item in test_store1.get_status()]
+        source_list.extend([{"a":numpy.array([1, 2])}, {"a":numpy.array([1, 2, 3])}, {"a":[4]}])
+        test_store1.copy_from_source()
+        test_store1.preprocess()
+        assert [{'values': [[1, 2], [1, 2, 3], [4]]}] == test_store1.get_payload()
+
     def test_WmlBundleRestHandler_single_list_input(self):
 
         print("############# test_WmlBundleRestHandler_single_list_input() ###############")
@@ -567,7 +1710,7 @@ class Test(unittest.TestCase):
             deployments = deployments_()      
 
         # list of 10 tuples, 5 valid
-        source_list = [{"a":list([i+1,i+2,i+3,i+4,i+5]), "b": i+1, "c": i+2} for i in range(10)]
+        source_list = BundleQueue([{"a":list([i+1,i+2,i+3,i+4,i+5]), "b": i+1, "c": i+2} for i in range(10)])
 
         ###################################################
         #initialize the handler class
@@ -576,6 +1719,7 @@ class Test(unittest.TestCase):
         WmlBundleRestHandler.max_copy_size = 5
         lock = threading.Condition()
         WmlBundleRestHandler.input_list_lock = lock
+        WmlBundleRestHandler.input_list_space = None
         WmlBundleRestHandler.source_data_list = source_list
         WmlBundleRestHandler.single_output = False
         WmlBundleRestHandler.field_mapping=[{"model_field":"__array__", "tuple_field":"a"}]